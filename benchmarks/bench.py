@@ -0,0 +1,168 @@
+"""
+Бенчмарки парсера на синтетических выгрузках.
+
+Пример: python benchmarks/bench.py --sizes 10000 100000 --sortedness 0.95
+Результаты дописываются в benchmarks/results.jsonl, чтобы отслеживать их между версиями
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from multiprocessing import Process, Queue
+from typing import Callable, Dict, List, Tuple
+
+import ujson
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+from generate import ExportConfig, generate_export  # noqa: E402
+from json_parser import JsonParser  # noqa: E402
+from enums import JSONFieldNames  # noqa: E402
+from main import QUEUE_MAXSIZE, iter_queue, produce  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from sinks import NullSink, SinkQueue  # noqa: E402
+
+
+RESULTS_PATH = os.path.join(BENCHMARKS_DIR, "results.jsonl")
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# find_duplicates квадратичен, поэтому замеряется на начале выгрузки
+FIND_DUPLICATES_SAMPLE = 2_000
+FIND_DUPLICATES_TARGETS = 200
+
+
+def export_path(config: ExportConfig) -> str:
+    """Сгенерированные выгрузки переиспользуются между запусками"""
+    name = "products-parser-bench-{products}-{duplicate_rate}-{sortedness}-{non_colored_rate}-{leftovers_size}-{seed}.json"
+    path = os.path.join(tempfile.gettempdir(), name.format(**asdict(config)))
+    if not os.path.exists(path):
+        generate_export(path, config)
+    return path
+
+
+# Каждый бенчмарк возвращает количество обработанных элементов и время в секундах
+BenchResult = Tuple[int, float]
+
+
+def bench_parser_run(json_file: str, **parser_options) -> BenchResult:
+    queue = SinkQueue(NullSink())
+    parser = JsonParser(json_file=json_file, queue=queue, **parser_options)
+    start = time.perf_counter()
+    parser.run()
+    return queue.sink.written, time.perf_counter() - start
+
+
+def bench_find_duplicates(json_file: str) -> BenchResult:
+    parser = JsonParser(json_file=json_file, queue=SinkQueue(NullSink()))
+    with open(json_file) as file:
+        products = ujson.load(file)[:FIND_DUPLICATES_SAMPLE]
+    step = max(1, len(products) // FIND_DUPLICATES_TARGETS)
+    targets = products[::step]
+    start = time.perf_counter()
+    for target in targets:
+        parser.find_duplicates(
+            filtered_id=parser.filter_id(target[JSONFieldNames.id.value]),
+            target_color=target[JSONFieldNames.color.value],
+            products=products,
+        )
+    return len(targets), time.perf_counter() - start
+
+
+def bench_merge_leftovers(json_file: str) -> BenchResult:
+    parser = JsonParser(json_file=json_file, queue=SinkQueue(NullSink()))
+    with open(json_file) as file:
+        products = ujson.load(file)
+    groups: Dict[str, List] = {}
+    for product in products:
+        unique_id = parser._get_unique_id(
+            parser.filter_id(product[JSONFieldNames.id.value]),
+            product[JSONFieldNames.color.value],
+        )
+        groups.setdefault(unique_id, []).append(product[JSONFieldNames.leftovers.value])
+
+    start = time.perf_counter()
+    for leftovers_lists in groups.values():
+        parser._merge_leftovers(leftovers_lists, price=0)
+    return len(products), time.perf_counter() - start
+
+
+def bench_pipeline(json_file: str) -> BenchResult:
+    """Парсер в отдельном процессе, очередь и потребитель, складывающий товары в память"""
+    queue = Queue(maxsize=QUEUE_MAXSIZE)
+    parser = JsonParser(json_file=json_file, queue=queue)
+    start = time.perf_counter()
+    parser_process = Process(target=produce, args=(parser, queue))
+    parser_process.start()
+    products = list(iter_queue(queue, Metrics()))
+    parser_process.join()
+    return len(products), time.perf_counter() - start
+
+
+BENCHMARKS: Dict[str, Callable[[str], BenchResult]] = {
+    "parser_run_sequential": lambda path: bench_parser_run(path, sequential=True),
+    "parser_run_global": lambda path: bench_parser_run(path, sequential=False),
+    "parser_run_streaming": lambda path: bench_parser_run(path, sequential=True, streaming=True),
+    "find_duplicates": bench_find_duplicates,
+    "merge_leftovers": bench_merge_leftovers,
+    "pipeline": bench_pipeline,
+}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(name: str, config: ExportConfig) -> Dict:
+    json_file = export_path(config)
+    items, seconds = BENCHMARKS[name](json_file)
+    return {
+        "benchmark": name,
+        "products": config.products,
+        "items": items,
+        "seconds": seconds,
+        "items_per_second": items / seconds if seconds else 0.0,
+        "config": asdict(config),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--duplicate-rate", type=float, default=ExportConfig.duplicate_rate)
+    parser.add_argument("--sortedness", type=float, default=ExportConfig.sortedness)
+    parser.add_argument("--non-colored-rate", type=float, default=ExportConfig.non_colored_rate)
+    parser.add_argument("--leftovers-size", type=int, default=ExportConfig.leftovers_size)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    run_info = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_commit()}
+    with open(args.results, "a") as results_file:
+        for size in args.sizes:
+            config = ExportConfig(
+                products=size,
+                duplicate_rate=args.duplicate_rate,
+                sortedness=args.sortedness,
+                non_colored_rate=args.non_colored_rate,
+                leftovers_size=args.leftovers_size,
+            )
+            for name in args.benchmarks:
+                result = run_benchmark(name, config)
+                results_file.write(ujson.dumps({**run_info, **result}, ensure_ascii=False) + "\n")
+                print(
+                    f"{name:<24} {size:>10} products {result['seconds']:>9.3f} s "
+                    f"{result['items_per_second']:>12.0f} items/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Генератор синтетических выгрузок для бенчмарков парсера.
+
+Пример: python benchmarks/generate.py ../bench_100k.json --products 100000 --duplicate-rate 0.3
+"""
+import argparse
+import random
+from dataclasses import dataclass
+from typing import Dict, List, TextIO, Tuple
+
+import ujson
+
+
+DUPLICATE_SUFFIXES = ("-1", "-2", "-3", "-r", "-P")
+COLORED_CATEGORIES = ("Одежда", "Обувь", "Сумки", "Одежда аксессуары")
+NON_COLORED_CATEGORIES = ("Косметика", "Парфюмерия", "Аксессуары", "Текстиль для дома")
+BRANDS = tuple(
+    f"{name} {idx}" for idx in range(60)
+    for name in ("Dolce&Gabbana", "Хоум Концепт", "Coccinelle", "Levi's", "Ёлка")
+)
+COLORS = ("черный", "белый", "коричневый", "тёмно-синий", "желтый", "красный", "бежевый")
+SIZES = ("XXS", "XS", "S", "M", "L", "XL", "XXL", "36", "37", "38", "39", "40", "U")
+SEXES = ("М", "Ж", "У")
+
+
+@dataclass
+class ExportConfig:
+    products: int = 10_000
+    # Доля записей, являющихся дубликатами (sku с окончанием -1, -r, -P и т.д.)
+    duplicate_rate: float = 0.3
+    # Доля записей, оставшихся на своем месте в отсортированной выгрузке.
+    # 1.0 - дубликаты стоят рядом, 0.0 - выгрузка полностью перемешана
+    sortedness: float = 1.0
+    # Доля товаров из категорий без цвета (парфюмерия, косметика и т.д.)
+    non_colored_rate: float = 0.2
+    # Среднее количество размеров в остатках одной записи
+    leftovers_size: int = 3
+    seed: int = 0
+
+
+def generate_records(config: ExportConfig) -> List[Tuple[str, int, int]]:
+    """
+    Возвращает легковесное описание записей выгрузки: (sku, номер товара, номер записи).
+    Сами объекты товаров строятся при записи в файл, чтобы не держать их в памяти
+    """
+    rnd = random.Random(config.seed)
+    records = []
+    product_idx = 0
+    while len(records) < config.products:
+        sku = f"ART{product_idx:08d}"
+        records.append((sku, product_idx, 0))
+        copy_idx = 0
+        while rnd.random() < config.duplicate_rate and len(records) < config.products:
+            copy_idx += 1
+            records.append((sku + rnd.choice(DUPLICATE_SUFFIXES), product_idx, copy_idx))
+        product_idx += 1
+
+    for idx in range(len(records)):
+        if rnd.random() >= config.sortedness:
+            swap_idx = rnd.randrange(len(records))
+            records[idx], records[swap_idx] = records[swap_idx], records[idx]
+    return records
+
+
+def build_product(sku: str, product_idx: int, copy_idx: int, config: ExportConfig) -> Dict:
+    # Атрибуты товара зависят только от его номера, чтобы дубликаты совпадали
+    rnd = random.Random(f"{config.seed}:{product_idx}")
+    non_colored = rnd.random() < config.non_colored_rate
+    category = rnd.choice(NON_COLORED_CATEGORIES if non_colored else COLORED_CATEGORIES)
+    color = "" if non_colored else f"{rnd.randint(1, 999)}/{rnd.choice(COLORS)}"
+    price = rnd.randint(5, 2000) * 10
+    discount_price = rnd.choice((price, 0, price // 2))
+
+    # Остатки различаются между дубликатами
+    leftovers_rnd = random.Random(f"{config.seed}:{product_idx}:{copy_idx}")
+    sizes = leftovers_rnd.sample(
+        SIZES,
+        min(len(SIZES), max(1, leftovers_rnd.randint(1, 2 * config.leftovers_size - 1))),
+    )
+    return {
+        "title": f"Товар {product_idx}",
+        "sku": sku,
+        "color": color,
+        "brand": rnd.choice(BRANDS),
+        "sex": rnd.choice(SEXES),
+        "material": "хлопок 100%",
+        "size_table_type": category,
+        "root_category": category,
+        "fashion_season": "2023-1",
+        "fashion_collection": f"Collection {product_idx % 100}",
+        "fashion_collection_inner": "Inner collection",
+        "manufacture_country": "ИТАЛИЯ",
+        "category": category.lower(),
+        "price": price,
+        "discount_price": discount_price,
+        "in_the_sale": discount_price not in (0, price),
+        "leftovers": [
+            {"size": size, "count": leftovers_rnd.randint(0, 5), "price": price}
+            for size in sizes
+        ],
+    }
+
+
+def write_export(file: TextIO, config: ExportConfig) -> None:
+    """Записывает выгрузку в файл потоково, по одному товару"""
+    file.write("[\n")
+    for idx, (sku, product_idx, copy_idx) in enumerate(generate_records(config)):
+        if idx:
+            file.write(",\n")
+        file.write(ujson.dumps(build_product(sku, product_idx, copy_idx, config), ensure_ascii=False))
+    file.write("\n]\n")
+
+
+def generate_export(path: str, config: ExportConfig) -> None:
+    with open(path, "w") as file:
+        write_export(file, config)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--products", type=int, default=ExportConfig.products)
+    parser.add_argument("--duplicate-rate", type=float, default=ExportConfig.duplicate_rate)
+    parser.add_argument("--sortedness", type=float, default=ExportConfig.sortedness)
+    parser.add_argument("--non-colored-rate", type=float, default=ExportConfig.non_colored_rate)
+    parser.add_argument("--leftovers-size", type=int, default=ExportConfig.leftovers_size)
+    parser.add_argument("--seed", type=int, default=ExportConfig.seed)
+    args = parser.parse_args()
+
+    generate_export(
+        args.path,
+        ExportConfig(
+            products=args.products,
+            duplicate_rate=args.duplicate_rate,
+            sortedness=args.sortedness,
+            non_colored_rate=args.non_colored_rate,
+            leftovers_size=args.leftovers_size,
+            seed=args.seed,
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
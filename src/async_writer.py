@@ -0,0 +1,126 @@
+import asyncio
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Set
+
+from loguru import logger
+
+from writers import BatchWriter
+from metrics import Metrics
+
+
+# Количество товаров, забираемых из очереди процесса парсера за одно переключение в поток
+READ_CHUNK_SIZE = 1000
+
+
+class AsyncWriter:
+    """
+    Записывает пачки товаров в БД, не дожидаясь ответа сервера на предыдущие:
+    одновременно в полете до len(writers) пачек. Каждая пачка пишется в отдельном
+    потоке одним из писателей пула, поэтому счетчики и метрики писателя
+    не разделяются между потоками. Порядок записи пачек сохраняется,
+    только если в пуле один писатель
+    """
+    def __init__(
+        self,
+        writers: List[BatchWriter],
+        batch_size: int,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self._writers = writers
+        self._batch_size = batch_size
+        self._batch: List[Dict] = []
+        self.metrics = metrics or Metrics()
+        # Свободные писатели. Пока все заняты, write ждет - так ограничивается
+        # число пачек в полете и память под них
+        self._idle: asyncio.Queue[BatchWriter] = asyncio.Queue()
+        for writer in writers:
+            self._idle.put_nowait(writer)
+        self._tasks: Set[asyncio.Task] = set()
+        self._start = time.perf_counter()
+
+    @property
+    def written(self) -> int:
+        return sum(writer.written for writer in self._writers)
+
+    @property
+    def failed(self) -> int:
+        return sum(writer.failed for writer in self._writers)
+
+    async def write(self, product: Dict) -> None:
+        self._batch.append(product)
+        if len(self._batch) >= self._batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        batch = self._batch
+        self._batch = []
+        if not batch:
+            return
+
+        writer = await self._idle.get()
+        # Ошибка записи предыдущих пачек (например, потеря соединения) прерывает импорт
+        for done in [task for task in self._tasks if task.done()]:
+            self._tasks.discard(done)
+            done.result()
+        self._tasks.add(asyncio.create_task(self._write_batch(writer, batch)))
+
+    async def close(self) -> None:
+        await self.flush()
+        await asyncio.gather(*self._tasks)
+        for writer in self._writers:
+            self.metrics.merge(writer.metrics)
+
+        elapsed = time.perf_counter() - self._start
+        rate = self.written / elapsed if elapsed else 0
+        logger.info(
+            f"Written products: {self.written}, failed: {self.failed}, "
+            f"{rate:.0f} docs/s, {len(self._writers)} batches in flight"
+        )
+        skipped = sum(getattr(writer, "skipped", 0) for writer in self._writers)
+        if skipped:
+            logger.info(f"Unchanged products skipped: {skipped}")
+
+    async def _write_batch(self, writer: BatchWriter, batch: List[Dict]) -> None:
+        try:
+            await asyncio.to_thread(writer.write_batch, batch)
+        finally:
+            self._idle.put_nowait(writer)
+
+
+async def feed(products: Iterator[Dict], queue: asyncio.Queue) -> None:
+    """
+    Перекладывает товары из блокирующего итератора (очереди процесса парсера)
+    в asyncio-очередь пачками по READ_CHUNK_SIZE. Конец потока - None
+    """
+    try:
+        while True:
+            chunk = await asyncio.to_thread(list, islice(products, READ_CHUNK_SIZE))
+            if not chunk:
+                break
+            await queue.put(chunk)
+    except Exception:
+        # Иначе запись будет вечно ждать следующую пачку, ошибка поднимется из write_async
+        await queue.put(None)
+        raise
+    await queue.put(None)
+
+
+async def write_async(products: Iterator[Dict], writer: AsyncWriter, queue_maxsize: int) -> int:
+    """Записывает товары через asyncio-очередь, возвращает количество товаров"""
+    queue: asyncio.Queue[List[Dict] | None] = asyncio.Queue(
+        maxsize=max(1, queue_maxsize // READ_CHUNK_SIZE)
+    )
+    feeder = asyncio.create_task(feed(products, queue))
+    got_products = 0
+    try:
+        while (chunk := await queue.get()) is not None:
+            for prod in chunk:
+                await writer.write(prod)
+            got_products += len(chunk)
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+    await feeder
+    await writer.close()
+    return got_products
@@ -0,0 +1,97 @@
+import os
+from dataclasses import dataclass, field
+from typing import List, Set
+
+from loguru import logger
+import ujson
+
+from sharding import export_files
+
+
+@dataclass
+class Checkpoint:
+    """
+    Маркер в очереди товаров: все записи выгрузки до offset (в байтах) учтены
+    в товарах, отправленных перед маркером. При offset=None позиция неизвестна
+    (выгрузка парсится не потоково), и после перезапуска она парсится заново
+    """
+    offset: int | None = None
+
+
+@dataclass
+class ResumeState:
+    """Состояние прерванного импорта, собранное из журнала контрольных точек"""
+    offset: int | None = None
+    # Ключи id+color товаров, записанных в БД до последней контрольной точки
+    emitted: Set[str] = field(default_factory=set)
+    # Количество пачек записи, подтвержденных сервером
+    batches: int = 0
+
+
+class CheckpointJournal:
+    """
+    Журнал контрольных точек импорта (jsonl). Запись журнала - позиция во входном файле,
+    число подтвержденных пачек и ключи товаров, записанных после предыдущей точки.
+    Поэтому время записи точки пропорционально числу новых товаров, а не всех записанных
+    """
+    def __init__(self, path: str, json_path: str) -> None:
+        self._path = path
+        self._export = export_id(json_path)
+        self._emitted: List[str] = []
+
+    def add(self, unique_id: str) -> None:
+        self._emitted.append(unique_id)
+
+    def save(self, offset: int | None, batches: int) -> None:
+        record = {
+            "export": self._export,
+            "offset": offset,
+            "batches": batches,
+            "emitted": self._emitted,
+        }
+        with open(self._path, "a") as file:
+            file.write(ujson.dumps(record, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self._emitted = []
+
+    def load(self) -> ResumeState | None:
+        """Возвращает состояние прерванного импорта этой же выгрузки или None"""
+        if not os.path.exists(self._path):
+            return None
+
+        state = ResumeState()
+        with open(self._path) as file:
+            for line in file:
+                try:
+                    record = ujson.loads(line)
+                except ValueError:
+                    # Последняя запись могла оборваться при падении процесса
+                    logger.warning(f"Skipping broken checkpoint record in {self._path}")
+                    continue
+                if record["export"] != self._export:
+                    logger.warning(
+                        f"Checkpoint {self._path} belongs to another export, starting from scratch"
+                    )
+                    return None
+                state.offset = record["offset"]
+                state.batches = record["batches"]
+                state.emitted.update(record["emitted"])
+        logger.info(
+            f"Resuming import from offset {state.offset}, "
+            f"already written products: {len(state.emitted)}, batches: {state.batches}"
+        )
+        return state
+
+    def remove(self) -> None:
+        """Удаляет журнал после успешного импорта"""
+        if os.path.exists(self._path):
+            os.remove(self._path)
+
+
+def export_id(json_path: str) -> str:
+    """Идентификатор выгрузки: файлы, их размеры и время изменения"""
+    return ";".join(
+        f"{os.path.abspath(json_file)}:{os.path.getsize(json_file)}:{os.stat(json_file).st_mtime_ns}"
+        for json_file in export_files(json_path)
+    )
@@ -0,0 +1,362 @@
+import gc
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, TYPE_CHECKING
+from pprint import pformat
+
+from loguru import logger
+import numpy as np
+
+from field_plan import FieldPlan
+from metrics import timed
+from models import Leftovers, Product, intern
+
+if TYPE_CHECKING:
+    from json_parser import JsonParser
+
+
+# Сколько окон после закрытия группы помнится номер ее последней записи
+# для расчета max_late_distance. Дальние дубликаты только считаются
+LATE_DISTANCE_WINDOWS = 4
+
+
+@dataclass
+class LeftoversSum:
+    """Остатки записей группы, суммированные по размерам"""
+    sizes_to_quantity: Dict[str, int] = field(default_factory=dict)
+    # Цена последней строки остатков ("последняя цена побеждает")
+    price: int | None = None
+
+    def add(self, leftovers: List[Dict], row: Callable[[Dict], Tuple[str, int, int]]) -> None:
+        """row - FieldPlan.leftover_row, достает (size, count, price) строки остатков"""
+        if not leftovers:
+            return
+        sizes_to_quantity = self.sizes_to_quantity
+        for size, quantity, price in map(row, leftovers):
+            sizes_to_quantity[size] = sizes_to_quantity.get(size, 0) + quantity
+        self.price = price
+
+    def merge(self, other: "LeftoversSum") -> None:
+        """Добавляет остатки записей, идущих в выгрузке после уже учтенных"""
+        if not other.sizes_to_quantity:
+            return
+        sizes_to_quantity = self.sizes_to_quantity
+        for size, quantity in other.sizes_to_quantity.items():
+            sizes_to_quantity[size] = sizes_to_quantity.get(size, 0) + quantity
+        self.price = other.price
+
+    def build(self) -> Leftovers:
+        return Leftovers.from_sizes(self.sizes_to_quantity, self.price)
+
+
+class LeftoversTable:
+    """
+    Остатки записей всех групп. При подсчете строки остатков собираются в колонки
+    (номер группы, размер, количество, цена), и суммы по размерам для всех групп
+    считаются одним векторным group-by вместо суммирования по строкам в словарях.
+    Результат совпадает с LeftoversSum: размеры в порядке появления в группе,
+    цена всех размеров - цена последней строки группы. Если среди количеств есть
+    нецелые (например, 1.5), остатки суммируются через LeftoversSum
+    """
+    def __init__(self, fields: FieldPlan) -> None:
+        self._fields = fields
+        self.clear()
+
+    def clear(self) -> None:
+        # Номер группы и остатки каждой добавленной записи
+        self._groups: List[int] = []
+        self._leftovers: List[List[Dict]] = []
+
+    def add(self, group_idx: int, leftovers: List[Dict]) -> None:
+        self._groups.append(group_idx)
+        self._leftovers.append(leftovers)
+
+    def aggregate(self, groups: int) -> List[Leftovers]:
+        """Возвращает остатки групп 0..groups-1 и очищает таблицу"""
+        # Создаются сотни тысяч объектов без циклических ссылок. Сборщик мусора
+        # при этом многократно обходит всю загруженную выгрузку, что дольше самого подсчета
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            result = self._aggregate(groups)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        self.clear()
+        return result
+
+    def _aggregate(self, groups: int) -> List[Leftovers]:
+        result: List[Leftovers | None] = [None] * groups
+        rows = [l_over for leftovers in self._leftovers for l_over in leftovers]
+        if not rows:
+            return self._fill_empty(result)
+
+        # Колонки собираются через map, без цикла по строкам на Python
+        group_col = np.repeat(
+            np.array(self._groups, dtype=np.int64),
+            np.fromiter(map(len, self._leftovers), dtype=np.int64, count=len(self._leftovers)),
+        )
+        fields = self._fields
+        counts = list(map(itemgetter(fields.quantity), rows))
+        # Целые числа Python дают колонку int64, дробные - float64, слишком большие
+        # или не числа - uint64 или object. Приведение к int64 исказило бы их
+        count_col = np.array(counts)
+        if count_col.dtype != np.int64:
+            return self._aggregate_rows(groups)
+        sizes = list(map(itemgetter(fields.size), rows))
+        # Цена нужна только из последней строки группы, поэтому не приводится к числу
+        prices = list(map(itemgetter(fields.price), rows))
+        size_names = [intern(size) for size in dict.fromkeys(sizes)]
+        size_codes = {size: code for code, size in enumerate(size_names)}
+        sizes_count = len(size_names)
+        keys = group_col * sizes_count + np.fromiter(
+            map(size_codes.__getitem__, sizes), dtype=np.int64, count=len(rows)
+        )
+
+        # Строки одной пары группа+размер идут подряд, внутри пары - в порядке выгрузки
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sums = np.add.reduceat(count_col[order], starts)
+        pair_groups = sorted_keys[starts] // sizes_count
+        # Размеры группы упорядочиваются по первой строке размера
+        pair_order = np.lexsort((order[starts], pair_groups))
+        pair_groups = pair_groups[pair_order]
+        pair_sizes = (sorted_keys[starts] % sizes_count)[pair_order].tolist()
+        quantities = sums[pair_order].tolist()
+
+        # Последняя строка каждой группы ("последняя цена побеждает")
+        _, reversed_idx = np.unique(group_col[::-1], return_index=True)
+        last_rows = len(group_col) - 1 - reversed_idx
+
+        bounds = np.flatnonzero(np.r_[True, pair_groups[1:] != pair_groups[:-1]])
+        for group_idx, start, end, last_row in zip(
+            pair_groups[bounds].tolist(),
+            bounds.tolist(),
+            bounds[1:].tolist() + [len(pair_groups)],
+            last_rows.tolist(),
+        ):
+            result[group_idx] = Leftovers(
+                sizes=tuple(size_names[code] for code in pair_sizes[start:end]),
+                counts=array("q", quantities[start:end]),
+                price=prices[last_row],
+            )
+        return self._fill_empty(result)
+
+    def _aggregate_rows(self, groups: int) -> List[Leftovers]:
+        """Суммирование по строкам, как в LeftoversSum"""
+        sums = [LeftoversSum() for _ in range(groups)]
+        row = self._fields.leftover_row
+        for group_idx, leftovers in zip(self._groups, self._leftovers):
+            sums[group_idx].add(leftovers, row)
+        return [total.build() for total in sums]
+
+    def _fill_empty(self, result: List[Leftovers | None]) -> List[Leftovers]:
+        """Группы, у записей которых не было остатков"""
+        return [
+            leftovers if leftovers is not None 
+            else Leftovers(sizes=(), counts=array("q"), price=None)
+            for leftovers in result
+        ]
+
+
+@dataclass
+class ProductGroup:
+    """
+    Группа записей выгрузки с одинаковыми filtered_id и сырым цветом.
+    Хранит распарсенный головной товар и накопленные остатки по размерам
+    """
+    unique_id: str
+    product: Product
+    leftovers: LeftoversSum = field(default_factory=LeftoversSum)
+
+    def add_leftovers(self, leftovers: List[Dict], fields: FieldPlan) -> None:
+        self.leftovers.add(leftovers, fields.leftover_row)
+
+    def build(self, leftovers: Leftovers | None = None) -> Product:
+        """
+        Возвращает товар с суммированными остатками всей группы.
+        leftovers - остатки, посчитанные для группы в LeftoversTable
+        """
+        self.product.leftovers = leftovers if leftovers is not None else self.leftovers.build()
+        self.product.unique_id = self.unique_id
+        return self.product
+
+
+class Consolidator:
+    """
+    Группирует записи выгрузки по (filtered_id, сырой цвет) за один проход
+    и суммирует остатки дубликатов.
+
+    Головной товар группы - первая запись, прошедшая parse_product,
+    остатки суммируются начиная с нее. Товары отдаются в порядке головных записей.
+
+    При sequential=False группы закрываются только в конце выгрузки,
+    поэтому порядок записей в выгрузке не важен.
+    При sequential=True группы закрываются, как только заканчивается серия
+    одинаковых filtered_id, а более поздние записи уже отданных товаров
+    пропускаются - поведение совпадает с прежним SEQUENTIAL=True.
+
+    При sorted_input=True записи отсортированы по (filtered_id, id+color) и повторных
+    записей отданных товаров не бывает, поэтому их ключи не запоминаются -
+    память не растет с размером выгрузки.
+
+    При window > 0 (почти отсортированная выгрузка) группа закрывается, как только
+    в последних window записях не было ее записей. Более поздние записи уже отданных
+    товаров пропускаются и считаются в late_duplicates, а max_late_distance -
+    наибольшее расстояние от последней записи группы до пропущенной. Номер последней
+    записи хранится только LATE_DISTANCE_WINDOWS окон после закрытия группы, поэтому
+    память ограничена размером окна, а более дальние дубликаты считаются
+    в far_late_duplicates. По ним подбирается размер окна.
+
+    При vectorized=True и sequential=False остатки всех групп копятся
+    в LeftoversTable и суммируются одним group-by при закрытии групп.
+    При sequential=True группы закрываются на каждой смене id и слишком малы
+    для векторного суммирования, поэтому vectorized не используется
+    """
+    def __init__(
+        self, 
+        parser: "JsonParser", 
+        sequential: bool, 
+        vectorized: bool = False,
+        seen: Set[str] | None = None,
+        sorted_input: bool = False,
+        window: int = 0,
+    ) -> None:
+        self._parser = parser
+        self._fields = parser.fields
+        self._sequential = sequential
+        self._sorted_input = sorted_input
+        self.metrics = parser.metrics
+        # Открытые группы в порядке появления головных записей
+        self._groups: Dict[str, ProductGroup] = {}
+        self._table = LeftoversTable(self._fields) if vectorized and not sequential and not window else None
+        # Номер группы в таблице остатков: порядковый номер среди открытых групп
+        self._group_idx: Dict[str, int] = {}
+        # Уникальные идентификаторы уже отданных товаров: id+color.
+        # При возобновлении импорта - товары, записанные до перезапуска
+        self._seen: Set[str] = seen if seen is not None else set()
+        self._run_id: str | None = None
+        self._window = window
+        # Номер текущей записи выгрузки
+        self._record_idx = 0
+        # Номер последней записи открытых групп, от давних к недавним
+        self._last_idx: OrderedDict[str, int] = OrderedDict()
+        # Номер последней записи товаров, отданных за последние LATE_DISTANCE_WINDOWS окон,
+        # от давних к недавним
+        self._closed_at: OrderedDict[str, int] = OrderedDict()
+        self.late_duplicates = 0
+        self.max_late_distance = 0
+        # Пропущенные дубликаты дальше LATE_DISTANCE_WINDOWS окон от своей группы
+        self.far_late_duplicates = 0
+
+    def consolidate(self, products: Iterable[Dict]) -> Iterator[Product]:
+        for product in products:
+            yield from self.add(product)
+        yield from self.flush()
+
+    def add(self, product: Dict) -> Iterator[Product]:
+        """Добавляет запись выгрузки, возвращает товары закрывшихся групп"""
+        logger.opt(lazy=True).debug(
+            "Processing product: \n{}", lambda: pformat(product)
+        )
+        sku, raw_color = self._fields.id_and_color(product)
+        filtered_id = self._parser.filter_id(sku)
+        unique_id = self._parser._get_unique_id(filtered_id, raw_color)
+
+        if self._sequential and filtered_id != self._run_id:
+            # Серия одинаковых id закончилась - дубликатов у открытых групп больше нет
+            yield from self.flush()
+            self._run_id = filtered_id
+        if self._window:
+            yield from self._close_expired()
+            self._record_idx += 1
+
+        group = self._groups.get(unique_id)
+        if group is not None:
+            self._add_leftovers(group, product[self._fields.leftovers])
+            self._touch(unique_id)
+            return
+
+        # Если уже суммировались остатки товара и его дубликатов
+        if unique_id in self._seen:
+            if self._window:
+                self._count_late(unique_id)
+            return
+
+        parsed_prod = self._parser.parse_product(product, filtered_id)
+        if parsed_prod is None:
+            # Не валидный формат объекта товара
+            return
+
+        group = ProductGroup(unique_id=unique_id, product=parsed_prod)
+        self._add_leftovers(group, product[self._fields.leftovers])
+        self._groups[unique_id] = group
+        self._touch(unique_id)
+
+    def flush(self) -> Iterator[Product]:
+        """Закрывает все открытые группы"""
+        groups = self._groups
+        self._groups = {}
+        table_leftovers = self._aggregate(len(groups)) if self._table is not None else None
+        self._group_idx = {}
+        for group_idx, (unique_id, group) in enumerate(groups.items()):
+            if not self._sorted_input:
+                self._seen.add(unique_id)
+            if self._window:
+                self._closed_at[unique_id] = self._last_idx.pop(unique_id)
+            leftovers = table_leftovers[group_idx] if table_leftovers is not None else None
+            yield self._build(group, leftovers)
+
+    def _touch(self, unique_id: str) -> None:
+        """Запоминает номер последней записи группы"""
+        if self._window:
+            self._last_idx[unique_id] = self._record_idx - 1
+            self._last_idx.move_to_end(unique_id)
+
+    def _close_expired(self) -> Iterator[Product]:
+        """Закрывает группы, последняя запись которых вышла за окно"""
+        closed_at = self._closed_at
+        horizon = self._record_idx - self._window * LATE_DISTANCE_WINDOWS
+        while closed_at and next(iter(closed_at.values())) < horizon:
+            closed_at.popitem(last=False)
+
+        last_idx = self._last_idx
+        oldest = self._record_idx - self._window
+        while last_idx:
+            unique_id, idx = next(iter(last_idx.items()))
+            if idx >= oldest:
+                return
+            last_idx.popitem(last=False)
+            self._seen.add(unique_id)
+            self._closed_at[unique_id] = idx
+            yield self._build(self._groups.pop(unique_id))
+
+    def _count_late(self, unique_id: str) -> None:
+        """Дубликат уже отданного товара, найденный за пределами окна"""
+        self.late_duplicates += 1
+        closed_at = self._closed_at.get(unique_id)
+        if closed_at is None:
+            self.far_late_duplicates += 1
+        else:
+            self.max_late_distance = max(self.max_late_distance, self._record_idx - 1 - closed_at)
+
+    @timed("consolidate")
+    def _add_leftovers(self, group: ProductGroup, leftovers: List[Dict]) -> None:
+        if self._table is None:
+            group.add_leftovers(leftovers, self._fields)
+            return
+        group_idx = self._group_idx.get(group.unique_id)
+        if group_idx is None:
+            group_idx = self._group_idx[group.unique_id] = len(self._group_idx)
+        self._table.add(group_idx, leftovers)
+
+    @timed("consolidate", per_call=False)
+    def _aggregate(self, groups: int) -> List[Leftovers]:
+        return self._table.aggregate(groups)
+
+    @timed("consolidate")
+    def _build(self, group: ProductGroup, leftovers: Leftovers | None = None) -> Product:
+        return group.build(leftovers)
@@ -1,8 +1,26 @@
+import os
+from typing import Dict, Tuple
+
 from pymongo import MongoClient
+from pymongo.database import Database
 
 from settings import Settings
 
 
-def get_db(settings: Settings) -> None:
-    client = MongoClient(settings.conn_str)
-    return client[settings._db_name]
\ No newline at end of file
+# Клиенты по процессу и параметрам подключения. У клиента свой пул соединений,
+# поэтому он создается один раз, а не на каждый get_db
+_clients: Dict[Tuple, MongoClient] = {}
+
+
+def get_client(settings: Settings) -> MongoClient:
+    options = settings.client_options
+    # Клиент нельзя использовать в дочернем процессе, созданном через fork
+    key = (os.getpid(), settings.conn_str, tuple(sorted(options.items())))
+    client = _clients.get(key)
+    if client is None:
+        client = _clients[key] = MongoClient(settings.conn_str, **options)
+    return client
+
+
+def get_db(settings: Settings) -> Database:
+    return get_client(settings)[settings._db_name]
@@ -0,0 +1,118 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterator
+
+import ujson
+
+from enums import DeltaStatus
+from json_parser import JsonParser
+from models import LEFTOVER_QUANTITY, LEFTOVER_SIZE, UNIQUE_ID_FIELD, Product
+from writers import content_hash
+
+
+# Снимок выгрузки: unique_id -> {"hash": хэш товара, "leftovers": {размер: количество}}
+Snapshot = Dict[str, Dict]
+
+
+@dataclass
+class ProductDelta:
+    unique_id: str
+    status: DeltaStatus
+    # Новый объект товара, для удаленных товаров - None
+    product: Dict | None = None
+    # Изменение количества по размерам: новое - старое, нулевые разницы не хранятся
+    leftovers_diff: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict:
+        return {
+            UNIQUE_ID_FIELD: self.unique_id,
+            "status": self.status.value,
+            "leftovers_diff": self.leftovers_diff,
+            "product": self.product,
+        }
+
+
+class DeltaTracker:
+    """
+    Сравнивает товары новой выгрузки со снимком предыдущей
+    и отдает только добавленные, удаленные и изменившиеся товары
+    """
+    def __init__(self, previous: Snapshot) -> None:
+        self._previous = previous
+        self.snapshot: Snapshot = {}
+
+    def add(self, product: Dict) -> ProductDelta | None:
+        """Возвращает изменение товара или None, если товар не изменился"""
+        unique_id = product[UNIQUE_ID_FIELD]
+        entry = snapshot_entry(product)
+        self.snapshot[unique_id] = entry
+
+        previous_entry = self._previous.get(unique_id)
+        if previous_entry is None:
+            return ProductDelta(
+                unique_id=unique_id,
+                status=DeltaStatus.added,
+                product=product,
+                leftovers_diff=leftovers_diff({}, entry["leftovers"]),
+            )
+        if previous_entry["hash"] == entry["hash"]:
+            return None
+        return ProductDelta(
+            unique_id=unique_id,
+            status=DeltaStatus.changed,
+            product=product,
+            leftovers_diff=leftovers_diff(previous_entry["leftovers"], entry["leftovers"]),
+        )
+
+    def removed(self) -> Iterator[ProductDelta]:
+        """Товары предыдущей выгрузки, которых нет в новой. Вызывается после всех add"""
+        for unique_id, previous_entry in self._previous.items():
+            if unique_id not in self.snapshot:
+                yield ProductDelta(
+                    unique_id=unique_id,
+                    status=DeltaStatus.removed,
+                    leftovers_diff=leftovers_diff(previous_entry["leftovers"], {}),
+                )
+
+
+class SnapshotBuilder:
+    """Собирает снимок из товаров парсера, передается в JsonParser вместо очереди"""
+    def __init__(self) -> None:
+        self.snapshot: Snapshot = {}
+
+    def put(self, product: Product) -> None:
+        self.snapshot[product.unique_id] = snapshot_entry(product.to_dict())
+
+
+def snapshot_entry(product: Dict) -> Dict:
+    return {
+        "hash": content_hash(product),
+        "leftovers": {
+            l_over[LEFTOVER_SIZE]: l_over[LEFTOVER_QUANTITY] for l_over in product["leftovers"]
+        },
+    }
+
+
+def leftovers_diff(previous: Dict[str, int], current: Dict[str, int]) -> Dict[str, int]:
+    diff = {}
+    for size in (*current, *previous):
+        quantity = current.get(size, 0) - previous.get(size, 0)
+        if quantity:
+            diff[size] = quantity
+    return diff
+
+
+def snapshot_from_export(json_file: str) -> Snapshot:
+    """Строит снимок предыдущей выгрузки, прогоняя ее через парсер"""
+    builder = SnapshotBuilder()
+    JsonParser(json_file=json_file, queue=builder).run()
+    return builder.snapshot
+
+
+def load_snapshot(path: str) -> Snapshot:
+    with open(path) as file:
+        return ujson.load(file)
+
+
+def save_snapshot(path: str, snapshot: Snapshot) -> None:
+    with open(path, "w") as file:
+        ujson.dump(snapshot, file, ensure_ascii=False)
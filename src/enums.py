@@ -35,3 +35,17 @@ class Sex(Enum):
 
 class Category(Enum):
     perfumery = "Парфюмерия"
+
+
+class DeltaStatus(Enum):
+    """Тип изменения товара между двумя выгрузками"""
+    added = "added"
+    removed = "removed"
+    changed = "changed"
+
+
+class RejectReason(Enum):
+    """Причина, по которой товар выгрузки отправлен в карантин"""
+    malformed = "malformed"
+    unknown_sex = "unknown_sex"
+    unknown_color_delimiter = "unknown_color_delimiter"
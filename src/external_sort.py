@@ -0,0 +1,70 @@
+import heapq
+import os
+import tempfile
+import time
+from itertools import islice
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from loguru import logger
+import ujson
+
+from metrics import Metrics
+
+
+# Количество записей выгрузки в одной отсортированной серии в памяти
+SORT_RUN_SIZE = 200_000
+# Директория для временных файлов серий, None - системная временная директория
+SORT_TMP_DIR: str | None = None
+
+# (filtered_id, id+color, порядковый номер записи в выгрузке)
+SortKey = Tuple[str, str, int]
+
+
+def external_sort(
+    records: Iterable[Tuple[SortKey, Dict]],
+    metrics: Metrics,
+    run_size: int = SORT_RUN_SIZE,
+    tmp_dir: str | None = SORT_TMP_DIR,
+) -> Iterator[Dict]:
+    """
+    Сортирует записи выгрузки по ключу внешней сортировкой слиянием: записи
+    читаются сериями по run_size, каждая серия сортируется в памяти и пишется
+    во временный jsonl-файл, затем серии сливаются через heapq.merge.
+    В памяти держится одна серия при записи и по одной строке каждой серии при слиянии.
+    Порядковый номер в ключе сохраняет исходный порядок записей с одинаковым id+color
+    """
+    records = iter(records)
+    run_stats = metrics.stage("sort_run")
+    with tempfile.TemporaryDirectory(prefix="products-sort-", dir=tmp_dir) as directory:
+        runs: List[str] = []
+        while run := list(islice(records, run_size)):
+            start = time.perf_counter()
+            run.sort(key=itemgetter(0))
+            if not runs and len(run) < run_size:
+                # Выгрузка поместилась в одну серию - слияние не нужно
+                run_stats.add(time.perf_counter() - start, items=len(run))
+                yield from map(itemgetter(1), run)
+                return
+
+            path = os.path.join(directory, f"run-{len(runs)}.jsonl")
+            with open(path, "w", encoding="utf-8") as file:
+                dumps = ujson.dumps
+                file.writelines(
+                    dumps([*key, product], ensure_ascii=False) + "\n" for key, product in run
+                )
+            runs.append(path)
+            run_stats.add(time.perf_counter() - start, items=len(run))
+
+        if not runs:
+            return
+        logger.info(f"Merging {len(runs)} sorted runs")
+        files = [open(path, encoding="utf-8") for path in runs]
+        try:
+            # Строки сравниваются по ключу, порядковый номер уникален,
+            # поэтому до сравнения самих товаров дело не доходит
+            for row in heapq.merge(*(map(ujson.loads, file) for file in files)):
+                yield row[3]
+        finally:
+            for file in files:
+                file.close()
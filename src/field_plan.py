@@ -0,0 +1,53 @@
+import re
+from dataclasses import dataclass
+from enum import Enum
+from operator import itemgetter
+from typing import Callable, Dict, Tuple, Type
+
+from enums import JSONFieldNames
+
+
+@dataclass(frozen=True)
+class FieldPlan:
+    """
+    План чтения полей записи выгрузки. Компилируется один раз при создании парсера
+    из маппинга JSONFieldNames: названия полей - готовые строки, поля, которые читаются
+    вместе, достаются одним itemgetter, окончание дубликата - скомпилированное
+    регулярное выражение. Во внутренних циклах не остается обращений к Enum
+    """
+    title: str
+    id: str
+    root_category: str
+    sex: str
+    color: str
+    color_code: str
+    brand: str
+    price: str
+    discount_price: str
+    size_table_type: str
+    in_the_sale: str
+    leftovers: str
+    quantity: str
+    size: str
+    # (id, color) записи - ключ группы дубликатов
+    id_and_color: Callable[[Dict], Tuple[str, str]]
+    # (price, discount_price) записи
+    prices: Callable[[Dict], Tuple[int, int]]
+    # (size, count, price) строки остатков
+    leftover_row: Callable[[Dict], Tuple[str, int, int]]
+    duplicate_ending: re.Pattern
+
+    @classmethod
+    def compile(cls, duplicate_ending: str, fields: Type[Enum] = JSONFieldNames) -> "FieldPlan":
+        keys = {field.name: field.value for field in fields}
+        return cls(
+            **keys,
+            id_and_color=itemgetter(keys["id"], keys["color"]),
+            prices=itemgetter(keys["price"], keys["discount_price"]),
+            leftover_row=itemgetter(keys["size"], keys["quantity"], keys["price"]),
+            duplicate_ending=re.compile(duplicate_ending),
+        )
+
+    def filter_id(self, id: str) -> str:
+        """Удаляет окончания -1, -2, -r и т.д. если они есть"""
+        return self.duplicate_ending.sub("", id)
@@ -0,0 +1,60 @@
+import time
+from typing import List
+
+from loguru import logger
+from pymongo import ASCENDING, IndexModel
+from pymongo.collection import Collection
+
+from models import UNIQUE_ID_FIELD
+from metrics import Metrics
+
+
+# Индексы коллекции товаров. Имена индексов - по умолчанию (например, "unique_id_1"),
+# чтобы совпадать с индексами, созданными ранее через create_index
+
+# Обновление товаров по ключу id+color (SYNC_MODE, DELTA_MODE, продолжение импорта).
+# Создается только в режимах обновления: при обычной вставке повторный импорт
+# в ту же коллекцию отклонялся бы по товару. Документы прежних версий импорта
+# без unique_id в индекс не попадают и не мешают его построению
+UNIQUE_ID_INDEX = IndexModel(
+    [(UNIQUE_ID_FIELD, ASCENDING)], 
+    unique=True, 
+    partialFilterExpression={UNIQUE_ID_FIELD: {"$exists": True}},
+)
+PRODUCT_INDEXES = [
+    # Поиск товара по артикулу и по артикулу с цветом
+    IndexModel([("sku", ASCENDING), ("color", ASCENDING)]),
+    IndexModel([("brand.slug", ASCENDING)]),
+    IndexModel([("root_category.slug", ASCENDING)]),
+    IndexModel([("color", ASCENDING)]),
+]
+
+
+def product_indexes(upsert: bool) -> List[IndexModel]:
+    """Индексы коллекции товаров, upsert - товары обновляются по ключу id+color"""
+    return [UNIQUE_ID_INDEX, *PRODUCT_INDEXES] if upsert else PRODUCT_INDEXES
+
+
+def ensure_indexes(
+    collection: Collection,
+    metrics: Metrics,
+    indexes: List[IndexModel] = PRODUCT_INDEXES,
+) -> float:
+    """
+    Создает недостающие индексы коллекции, уже существующие индексы не перестраиваются.
+    Возвращает время построения в секундах
+    """
+    start = time.perf_counter()
+    # Индекс с тем же именем, но другими параметрами (например, уникальный индекс
+    # по unique_id без partialFilterExpression из прежних версий) остается как есть,
+    # иначе create_indexes отклонит весь запрос
+    existing = collection.index_information()
+    missing = [index for index in indexes if index.document["name"] not in existing]
+    names = collection.create_indexes(missing) if missing else []
+    elapsed = time.perf_counter() - start
+    metrics.stage("index_build").add(elapsed, items=len(indexes))
+    logger.info(
+        f"Indexes of {collection.name} ensured in {elapsed:.2f}s, "
+        f"created: {', '.join(names) or 'none'}"
+    )
+    return elapsed
@@ -1,15 +1,25 @@
+import os
 import time
 import sys
 import re
 from multiprocessing import Queue
-from typing import List, Dict, Tuple
-from pprint import pformat
+from typing import List, Dict, Iterator, Tuple
 
 from loguru import logger
-import ujson
 from slugify import slugify
 
-from enums import Sex, JSONFieldNames
+from enums import Sex, JSONFieldNames, RejectReason
+from consolidation import LATE_DISTANCE_WINDOWS, Consolidator, LeftoversSum
+from field_plan import FieldPlan
+from models import Brand, Category, Product, intern
+from json_stream import iter_json_array, iter_json_array_offsets, load_mapped, load_projected, project
+from checkpoint import Checkpoint, ResumeState
+from sharding import consolidate_files, consolidate_sharded, export_files
+from parse_cache import ParseCache, cache_key
+from external_sort import SORT_RUN_SIZE, SORT_TMP_DIR, SortKey, external_sort
+from quarantine import Quarantine
+from slugs import cached_slugify, join_slugs
+from metrics import Metrics, timed, timed_iter
 
 
 DUPLICATE_ENDING = "-([0-9]|r|p|R|P)$"
@@ -24,6 +34,32 @@ NON_COLORED_CATEGORIES = (
     "Текстиль для дома #Маркировка",
 )
 SEQUENTIAL = True
+# Потоковое чтение выгрузки по одному товару вместо загрузки всего файла в память
+STREAMING = False
+# Суммирование остатков всех групп одним векторным group-by (numpy).
+# Используется только при SEQUENTIAL=False, когда группы закрываются в конце выгрузки
+VECTORIZED = True
+# Количество процессов для параллельного парсинга выгрузки по шардам.
+# При WORKERS > 1 дубликаты всегда суммируются по всей выгрузке, как при SEQUENTIAL=False
+WORKERS = 1
+# Проекция полей: при PROJECTED=True из товаров выгрузки сразу после декодирования
+# удаляются поля, которые парсер не читает (material, fashion_season и т.д.).
+# Выгрузка декодируется кусками, поэтому в памяти не держатся все поля всех товаров.
+# Отклоненные товары попадают в карантин тоже без этих полей
+PROJECTED = False
+PROJECTED_FIELDS = frozenset(field.value for field in JSONFieldNames)
+# Окно суммирования дубликатов для почти отсортированных выгрузок, в записях.
+# При WINDOW > 0 дубликаты суммируются, если стоят не дальше WINDOW записей друг от друга,
+# в памяти держатся только группы окна. Дубликаты за пределами окна пропускаются
+# и считаются в логе - по ним подбирается размер окна. Используется вместо SEQUENTIAL
+WINDOW = 0
+# Внешняя сортировка выгрузки на диске по id+color перед суммированием дубликатов.
+# Подходит для неотсортированных выгрузок больше оперативной памяти: память ограничена
+# размером серии SORT_RUN_SIZE. Товары отдаются в порядке ключей, а не выгрузки
+EXTERNAL_SORT = False
+# Директория кэша результатов парсинга, None - без кэша. Повторный запуск по той же
+# выгрузке с теми же настройками читает готовые товары из кэша, не разбирая JSON
+CACHE_DIR: str | None = None
 
 
 class JsonParser:
@@ -31,95 +67,295 @@ class JsonParser:
         self, 
         json_file: str,
         queue: Queue,
+        sequential: bool = SEQUENTIAL,
+        streaming: bool = STREAMING,
+        workers: int = WORKERS,
+        vectorized: bool = VECTORIZED,
+        checkpoint_interval: int = 0,
+        resume: ResumeState | None = None,
+        cache_dir: str | None = CACHE_DIR,
+        quarantine: Quarantine | None = None,
+        external_sort: bool = EXTERNAL_SORT,
+        window: int = WINDOW,
+        projected: bool = PROJECTED,
     ) -> None:
         self._json_file = json_file
         self._queue = queue
+        self._sequential = sequential
+        self._streaming = streaming
+        self._workers = workers
+        self._vectorized = vectorized
+        # Число товаров между контрольными точками в очереди, 0 - без контрольных точек
+        self._checkpoint_interval = checkpoint_interval
+        self._resume = resume
+        self._cache_dir = cache_dir
+        self._external_sort = external_sort
+        self._window = window
+        self._projected = projected
+        # Названия полей и окончание дубликата, скомпилированные из JSONFieldNames
+        self.fields = FieldPlan.compile(DUPLICATE_ENDING)
+        # Отклоненные товары с причиной, без карантина они только считаются
+        self.quarantine = quarantine or Quarantine()
         self.loaded_prods: List[Dict]
-
-        # Хранит уникальные идентификаторы уже обработанных товаров: id+color
-        self.seen_products: List[str] = []
+        # Объекты категорий по названию, разделяются всеми товарами категории
+        self._categories: Dict[str, Category] = {}
+        # Счетчики и длительности этапов обработки
+        self.metrics = Metrics()
 
         logger.configure(handlers=[{"level": "INFO", "sink": sys.stdout}])
 
     def run(self) -> None:
         start = time.perf_counter()
 
-        with open(self._json_file) as file:
-            self.loaded_prods = ujson.load(file)
+        queue_stats = self.metrics.stage("queue_put")
+        for consolidated_prod in self._consolidated_products():
+            put_start = time.perf_counter()
+            self._queue.put(consolidated_prod)
+            queue_stats.add(time.perf_counter() - put_start)
+        self.quarantine.close()
+        
+        logger.info(f"Total parse time: {time.perf_counter() - start:.2f}")
+        logger.info(f"Slug cache: {cached_slugify.cache_info()}")
+
+    def _consolidated_products(self) -> Iterator[Product | Checkpoint]:
+        json_files = export_files(self._json_file)
+        if (
+            self._checkpoint_interval 
+            and len(json_files) == 1 
+            and self._streaming 
+            and self._sequential 
+            and self._workers <= 1
+            and not self._external_sort
+            and not self._window
+        ):
+            yield from self._checkpointed_products(json_files[0])
+            return
 
-        logger.debug(f"Total json products quantity: {len(self.loaded_prods)}")
+        products = self._products(json_files)
+        if not self._checkpoint_interval:
+            yield from products
+            return
+        # Позиция во входном файле неизвестна, после перезапуска выгрузка парсится заново,
+        # а уже записанные товары пропускаются
+        for idx, product in enumerate(products, start=1):
+            yield product
+            if idx % self._checkpoint_interval == 0:
+                yield Checkpoint()
+
+    def _products(self, json_files: List[str]) -> Iterator[Product]:
+        if not json_files:
+            # Пустой поток выглядел бы как пустая выгрузка: в DELTA_MODE все товары
+            # считались бы удаленными
+            raise FileNotFoundError(f"No export files found: {self._json_file}")
+        if self._cache_dir is None:
+            yield from self._parse_products(json_files)
+            return
+
+        start = time.perf_counter()
+        cache = ParseCache(self._cache_dir, cache_key(json_files, self._cache_config(json_files)))
+        self.metrics.stage("cache_key").add(time.perf_counter() - start)
+        if cache.exists():
+            yield from cache.read(self.metrics.stage("cache_read"), self.quarantine)
+        else:
+            yield from cache.write(self._parse_products(json_files), self.quarantine.record())
+
+    def _cache_config(self, json_files: List[str]) -> Dict:
+        """Настройки, от которых зависит результат парсинга"""
+        return {
+            "non_colored_categories": list(NON_COLORED_CATEGORIES),
+            "duplicate_ending": DUPLICATE_ENDING,
+            # Несколько файлов и шарды всегда сводятся по всей выгрузке
+            "sequential": self._sequential and self._workers <= 1 and len(json_files) == 1,
+            "external_sort": self._external_sort,
+            "window": self._window,
+            # При проекции в карантин попадают записи без неиспользуемых полей
+            "projected": self._projected,
+            "fields": {field.name: field.value for field in JSONFieldNames},
+            "sex": {sex.name: sex.value for sex in Sex},
+        }
 
-        for product_idx, product in enumerate(self.loaded_prods):
-            logger.debug(f"Processing product: \n{pformat(product)}")
-            filtered_id = self.filter_id(product[JSONFieldNames.id.value])
-            raw_color = product[JSONFieldNames.color.value]
-            unique_id = self._get_unique_id(filtered_id, raw_color)
-            # Если уже суммировались остатки товара и его дубликатов
-            if unique_id in self.seen_products:
-                continue
-
-            parsed_prod = self.parse_product(product)
-            if parsed_prod is None:
-                # Не валидный формат объекта товара
-                continue
-
-            # Здесь передается стартовый индекс, т.к. известно, 
-            # что среди предыдущих товаров нет дубликатов текущего
-            consolidated_prod = self.consolidate_product(
-                parsed_prod, 
-                raw_color=product[JSONFieldNames.color.value], 
-                start_idx=product_idx,
+    def _parse_products(self, json_files: List[str]) -> Iterator[Product]:
+        if self._external_sort:
+            # После сортировки дубликаты стоят подряд, достаточно последовательного прохода
+            consolidator = Consolidator(parser=self, sequential=True, sorted_input=True)
+            yield from consolidator.consolidate(
+                external_sort(
+                    self._keyed_products(json_files), 
+                    metrics=self.metrics, 
+                    run_size=SORT_RUN_SIZE, 
+                    tmp_dir=SORT_TMP_DIR,
+                )
             )
-            self.seen_products.append(unique_id)
-            # logger.info(f"consolidated: {pformat(consolidated_prod)}")
+            return
 
-            self._queue.put(consolidated_prod)
-        
-        logger.info(f"Total parse time: {time.perf_counter() - start:.2f}")
+        if len(json_files) > 1:
+            # Выгрузки складов парсятся параллельно, остатки суммируются по всем файлам
+            workers = self._workers
+            if workers <= 1:
+                workers = min(len(json_files), os.cpu_count() or 1)
+            logger.info(f"Parsing {len(json_files)} export files with {workers} workers")
+            yield from consolidate_files(
+                json_files, 
+                workers=workers, 
+                metrics=self.metrics, 
+                quarantine=self.quarantine,
+                projected=self._projected,
+            )
+            return
+
+        json_file = json_files[0]
+        if self._workers > 1:
+            yield from consolidate_sharded(
+                json_file, 
+                workers=self._workers, 
+                metrics=self.metrics,
+                quarantine=self.quarantine,
+                projected=self._projected,
+            )
+            return
+
+        # Дубликаты группируются по id+color за один проход по выгрузке
+        consolidator = Consolidator(
+            parser=self, 
+            sequential=self._sequential and not self._window, 
+            vectorized=self._vectorized,
+            window=self._window,
+        )
+        yield from consolidator.consolidate(self._read_products(json_file))
+        if self._window:
+            horizon = self._window * LATE_DISTANCE_WINDOWS
+            near = consolidator.late_duplicates - consolidator.far_late_duplicates
+            # Расстояние известно только для дубликатов не дальше horizon записей
+            distance = (
+                f"max distance within {horizon} records: {consolidator.max_late_distance}, "
+                if near else ""
+            )
+            logger.info(
+                f"Duplicates outside the window of {self._window} records: "
+                f"{consolidator.late_duplicates}, {distance}"
+                f"farther than {horizon} records: {consolidator.far_late_duplicates}"
+            )
+
+    def _keyed_products(self, json_files: List[str]) -> Iterator[Tuple[SortKey, Dict]]:
+        """Потоково читает записи всех файлов выгрузки вместе с ключом сортировки"""
+        decode_stats = self.metrics.stage("json_decode")
+        id_and_color = self.fields.id_and_color
+        seq = 0
+        for json_file in json_files:
+            with open(json_file, encoding="utf-8") as file:
+                for product in timed_iter(iter_json_array(file), decode_stats):
+                    sku, raw_color = id_and_color(product)
+                    filtered_id = self.filter_id(sku)
+                    unique_id = self._get_unique_id(filtered_id, raw_color)
+                    yield (filtered_id, unique_id, seq), product
+                    seq += 1
+
+    def _checkpointed_products(self, json_file: str) -> Iterator[Product | Checkpoint]:
+        """
+        Потоковый парсинг отсортированной выгрузки с контрольными точками.
+        Точка ставится, когда закончилась серия одинаковых id: все записи до текущей
+        учтены в отданных товарах. После перезапуска чтение продолжается с позиции точки
+        """
+        offset = 0
+        seen = None
+        if self._resume is not None and self._resume.offset:
+            offset = self._resume.offset
+            # Более поздние записи уже записанных товаров пропускаются, как и без перезапуска
+            seen = set(self._resume.emitted)
+
+        consolidator = Consolidator(parser=self, sequential=True, seen=seen)
+        since_checkpoint = 0
+        # newline="": позиции считаются по байтам файла, \r\n не заменяется на \n
+        with open(json_file, encoding="utf-8", newline="") as file:
+            products = timed_iter(
+                iter_json_array_offsets(file, offset=offset),
+                self.metrics.stage("json_decode"),
+            )
+            for product, end in products:
+                closed = list(consolidator.add(product))
+                yield from closed
+                since_checkpoint += len(closed)
+                if closed and since_checkpoint >= self._checkpoint_interval:
+                    # offset - конец предыдущей записи, текущая уже открыла новую группу
+                    yield Checkpoint(offset=offset)
+                    since_checkpoint = 0
+                offset = end
+        yield from consolidator.flush()
 
-    def parse_product(self, product: Dict) -> Dict | None:
+    def _read_products(self, json_file: str) -> Iterator[Dict]:
+        """
+        Возвращает товары выгрузки. При streaming=True товары декодируются
+        по одному, и в памяти держатся только незакрытые группы дубликатов.
+        Иначе выгрузка декодируется целиком прямо из отображения файла в память
+        """
+        decode_stats = self.metrics.stage("json_decode")
+        if self._streaming:
+            with open(json_file, encoding="utf-8") as file:
+                yield from timed_iter(iter_json_array(file), decode_stats)
+            return
+
+        start = time.perf_counter()
+        if self._projected:
+            self.loaded_prods = load_projected(
+                json_file, 
+                PROJECTED_FIELDS, 
+                key=self.fields.id,
+            )
+        else:
+            self.loaded_prods = load_mapped(json_file)
+        decode_stats.add(time.perf_counter() - start, items=len(self.loaded_prods))
+        logger.debug(f"Total json products quantity: {len(self.loaded_prods)}")
+        yield from self.loaded_prods
+
+    def project(self, products: List[Dict]) -> List[Dict]:
+        """Удаляет неиспользуемые поля товаров при projected=True"""
+        return project(products, PROJECTED_FIELDS) if self._projected else products
+
+    @timed("parse_product")
+    def parse_product(self, product: Dict, filtered_id: str | None = None) -> Product | None:
         """
         Формирует новый объект товара, реализуя логику присвоения цен, 
-        формирования категории, 
+        формирования категории. Остатки заполняются при суммировании дубликатов.
+        filtered_id - уже отфильтрованный id товара, если его посчитал вызывающий код
         """
-        filtered_id = self.filter_id(product[JSONFieldNames.id.value])
+        fields = self.fields
+        if filtered_id is None:
+            filtered_id = self.filter_id(product[fields.id])
         category_obj = self._get_category_object(product)
         sex_name = self._get_prod_sex(product)
         if sex_name is None:
             return
-        price, discount_price = self._get_price_and_discount_price(
-            price=product[JSONFieldNames.price.value],
-            discount_price=product[JSONFieldNames.discount_price.value],
-        )
+        price, discount_price = self._get_price_and_discount_price(*fields.prices(product))
         splitted = self._get_prod_color_and_color_code(product)
         if splitted is None:
             return
         
         color, color_code = splitted
         try:
-            parsed_prod = {
-                "title": product[JSONFieldNames.title.value],
-                "sku": filtered_id,
-                "color": color,
-                "color_code": color_code,
-                "brand": self._get_brand_obj(
+            # Сами остатки суммируются по группе дубликатов, но товар без них не валиден
+            product[fields.leftovers]
+            parsed_prod = Product(
+                title=product[fields.title],
+                sku=filtered_id,
+                color=intern(color),
+                color_code=intern(color_code),
+                brand=self._get_brand_obj(
                     product=product,
                     color_code=color_code, 
                     color=color, 
                     sku=filtered_id,
                 ),
-                "sex": sex_name,
-                "root_category": category_obj,
-                "price": price,
-                "discount_price": discount_price,
-                "in_the_sale": product[JSONFieldNames.in_the_sale.value],
-                "size_table_type": product[JSONFieldNames.size_table_type.value],
-                "leftovers": product[JSONFieldNames.leftovers.value],
-            }
+                sex=sex_name,
+                root_category=category_obj,
+                price=price,
+                discount_price=discount_price,
+                in_the_sale=product[fields.in_the_sale],
+                size_table_type=intern(product[fields.size_table_type]),
+            )
             return parsed_prod
         except KeyError:
             # Не удалось прочитать какое-либо поле в json товара - объект пропускается
-            logger.warning(f"Malformed product object {product}")
+            self.quarantine.reject(product, RejectReason.malformed)
             return None
         
     def consolidate_product(self, product: Dict, raw_color: str, start_idx: int) -> Dict | None:
@@ -129,7 +365,8 @@ class JsonParser:
         Возвращает суммированный объект или ничего в случае если товар уже был обработан ранее. 
         """
         # Отфильтрованный id, не содержащий окончания -1, -2, -r, т.д.
-        prod_id = self.filter_id(product[JSONFieldNames.id.value])
+        fields = self.fields
+        prod_id = self.filter_id(product[fields.id])
 
         duplicates = self.find_duplicates(
             filtered_id=prod_id,
@@ -139,23 +376,24 @@ class JsonParser:
         )
         # if prod_id == "BB7337-AW576" and raw_color == "80999/черный":
         #     print("Dups: ", duplicates)
-        found_leftovers = [dupl[JSONFieldNames.leftovers.value] for dupl in duplicates]
+        found_leftovers = [dupl[fields.leftovers] for dupl in duplicates]
         total_leftovers = self._merge_leftovers(
             found_leftovers, 
-            price=product[JSONFieldNames.price.value]
+            price=product[fields.price]
         )
-        product[JSONFieldNames.id.value] = prod_id
-        product[JSONFieldNames.leftovers.value] = total_leftovers
+        product[fields.id] = prod_id
+        product[fields.leftovers] = total_leftovers
         return product
 
+    @timed("filter_id")
     def filter_id(self, id: str) -> str:
         """
         Удаляет окончания -1, -2, -r и т.д. если они есть
         """
-        return re.sub(DUPLICATE_ENDING, "", id)
+        return self.fields.filter_id(id)
     
     def id_match_duplicate(self, id: str) -> bool:
-        return True if re.fullmatch(DUPLICATE_REGEX, id) else False
+        return True if DUPLICATE_REGEX.fullmatch(id) else False
     
     def find_duplicates(
             self, 
@@ -170,10 +408,11 @@ class JsonParser:
         """
         res = []
         start = None
+        id_and_color = self.fields.id_and_color
         # Поиск индекса первого товара с filtered_id
         for idx, product in enumerate(products):
-            cur_id = self.filter_id(product[JSONFieldNames.id.value])
-            cur_color = product[JSONFieldNames.color.value]
+            cur_id, cur_color = id_and_color(product)
+            cur_id = self.filter_id(cur_id)
             if cur_id == filtered_id and cur_color == target_color:
                 start = idx
                 break
@@ -183,8 +422,8 @@ class JsonParser:
             return []
 
         for product in products[start:]:
-            cur_id = self.filter_id(product[JSONFieldNames.id.value])
-            cur_color = product[JSONFieldNames.color.value]
+            cur_id, cur_color = id_and_color(product)
+            cur_id = self.filter_id(cur_id)
             # if self._get_unique_id(cur_id, cur_color) in self.seen_products:
             #     continue
 
@@ -217,70 +456,64 @@ class JsonParser:
         """
         return f"{filtered_id}{raw_color}"
 
-    def _get_category_object(self, product: Dict) -> Dict:
-        category_name = product[JSONFieldNames.root_category.value]
-        return {
-            "name": category_name,
-            "slug": slugify(category_name),
-        }
+    @timed("slugify")
+    def _get_category_object(self, product: Dict) -> Category:
+        category_name = product[self.fields.root_category]
+        category = self._categories.get(category_name)
+        if category is None:
+            category = self._categories[category_name] = Category(
+                name=intern(category_name),
+                slug=cached_slugify(category_name),
+            )
+        return category
     
+    @timed("slugify")
     def _get_brand_obj(
         self, 
         product: Dict, 
         color_code: str, 
         color: str, 
         sku: str
-    ) -> Dict | None:
+    ) -> Brand:
         """
         Возвращает объект бренда и slug, 
         состоящий из названия бренда, кода цвета, названия цвета и артикула
         """
-        brand_name = product[JSONFieldNames.brand.value]
+        brand_name = product[self.fields.brand]
 
-        return {
-            "name": brand_name,
-            "slug": slugify(
-                f"{brand_name}+{color_code}+{color}+{sku}"
+        # Бренд может быть null или числом: в slug он попадает строкой, как в f-строке
+        return Brand(
+            name=intern(brand_name),
+            # То же, что slugify(f"{brand_name}+{color_code}+{color}+{sku}"),
+            # но транслитерация бренда и цвета берется из кэша
+            slug=join_slugs(
+                cached_slugify(str(brand_name)),
+                cached_slugify(color_code),
+                cached_slugify(color),
+                slugify(sku),
             ),
-        }
+        )
     
     def _merge_leftovers(self, leftovers_lists: List, price: int) -> List[Dict]:
-        # O(n)
-        sizes_to_quantity = {}
-
+        """
+        Суммирует остатки по размерам. Цена всех размеров - цена последней строки
+        остатков ("последняя цена побеждает"), price - если строк нет
+        """
+        total = LeftoversSum(price=price)
         for leftover_list in leftovers_lists:
-            for l_over in leftover_list:
-                size = l_over[JSONFieldNames.size.value]
-                quantity = l_over[JSONFieldNames.quantity.value]
-                price = l_over[JSONFieldNames.price.value]
-
-                if size not in sizes_to_quantity.keys():
-                    sizes_to_quantity[size] = 0
-                sizes_to_quantity[size] += quantity
-
-        res = []
-        for size, quantity in sizes_to_quantity.items():
-            res.append(
-                {
-                    JSONFieldNames.size.value: size,
-                    JSONFieldNames.quantity.value: quantity,
-                    JSONFieldNames.price.value: price,
-                }
-            )
-        return res
+            total.add(leftover_list, self.fields.leftover_row)
+        return total.build().to_list()
         
     def _get_prod_sex(self, product: Dict) -> str | None:
         """Возвращает название пола, соответствующего id в Enum"""
         try:
-            sex_id = product[JSONFieldNames.sex.value].lower()
+            sex_id = product[self.fields.sex].lower()
         except AttributeError:
             sex_id = ""
         try:
             return Sex(sex_id).name
         except ValueError:
-            logger.warning(
-                f"Product: {product}. \n\"{JSONFieldNames.sex.value}\" id is unknown"
-            )
+            self.quarantine.reject(product, RejectReason.unknown_sex)
     
     def _get_prod_color_and_color_code(
         self, 
@@ -290,14 +523,14 @@ class JsonParser:
         Возвращает название цвета, соответствующего id в в Enum. 
         Возвращает: (color, color_code) | None
         """
-        if product[JSONFieldNames.root_category.value] in NON_COLORED_CATEGORIES:
+        if product[self.fields.root_category] in NON_COLORED_CATEGORIES:
             return ("", "")
         
         try:
-            splitted_code_n_color = product[JSONFieldNames.color.value].split("/")
+            splitted_code_n_color = product[self.fields.color].split("/")
             return (splitted_code_n_color[1], splitted_code_n_color[0])
         except IndexError:
-            logger.warning(f"Unknown color delimiter: {product}")
+            self.quarantine.reject(product, RejectReason.unknown_color_delimiter)
     
     def _get_price_and_discount_price(
         self, 
@@ -0,0 +1,281 @@
+import gc
+import json
+import mmap
+import os
+import re
+from contextlib import contextmanager
+from typing import AbstractSet, BinaryIO, Dict, Iterator, List, TextIO, Tuple
+
+import ujson
+
+
+# Размер блока, читаемого из файла выгрузки за один раз
+CHUNK_SIZE = 1 << 20
+# Размер окна поиска границ объектов в файле выгрузки
+SEARCH_WINDOW = 1 << 16
+# Размер куска выгрузки, декодируемого за раз при чтении с проекцией полей
+PROJECTION_CHUNK_SIZE = 1 << 22
+_WHITESPACE = re.compile(r"\s*")
+# Пробелы и запятые между объектами массива
+_SEPARATORS = re.compile(r"[\s,]*")
+# Сколько символов в конце блока может занимать оборванный литерал, число
+# или escape-последовательность: ошибка декодирования в них - повод дочитать файл
+_TRUNCATED_TAIL = 16
+
+
+def iter_json_array(file: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[Dict]:
+    """
+    Потоково декодирует JSON-массив верхнего уровня, отдавая по одному элементу.
+    В памяти держится только текущий блок файла и недочитанный хвост объекта
+    """
+    for item, _ in _iter_array(file, chunk_size, offset=None):
+        yield item
+
+
+def iter_json_array_offsets(
+    file: TextIO, 
+    offset: int = 0, 
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Tuple[Dict, int]]:
+    """
+    То же, что iter_json_array, но вместе с элементом отдает позицию в байтах
+    сразу после него. При offset > 0 чтение продолжается с этой позиции,
+    полученной ранее, - с середины массива, без декодирования предыдущих элементов.
+    Файл открывается с newline="", иначе \\r\\n читается как \\n и позиции сдвигаются
+    """
+    if offset:
+        # Позиция - граница элемента, поэтому декодер utf-8 начинает с чистого состояния
+        file.seek(offset)
+    return _iter_array(file, chunk_size, offset=offset)
+
+
+def _iter_array(
+    file: TextIO, 
+    chunk_size: int, 
+    offset: int | None,
+) -> Iterator[Tuple[Dict, int | None]]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    # Чтение с середины массива начинается после "["
+    started = bool(offset)
+    track_offsets = offset is not None
+    # Позиция в байтах символа buffer[mark]
+    mark = 0
+
+    while True:
+        pattern = _SEPARATORS if started else _WHITESPACE
+        pos = pattern.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            if track_offsets:
+                offset += len(buffer[mark:pos].encode())
+                mark = 0
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("JSON top-level value is not an array")
+            started = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # Объект не поместился в прочитанный блок. Ошибка внутри блока - испорченная
+            # запись: дочитывать остаток файла до конца в буфер бессмысленно
+            if eof or not _is_truncated(e, buffer):
+                raise
+            end = None
+
+        if end is None or (end == len(buffer) and not eof):
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            if track_offsets:
+                offset += len(buffer[mark:pos].encode())
+                mark = 0
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if track_offsets:
+            offset += len(buffer[mark:end].encode())
+            mark = end
+        pos = end
+        yield item, offset
+
+
+def _is_truncated(error: json.JSONDecodeError, buffer: str) -> bool:
+    """Ошибка декодирования вызвана концом прочитанного блока, а не самим JSON"""
+    # Для незакрытой строки позиция ошибки - начало строки, но строка идет до конца блока
+    if error.msg.startswith("Unterminated string"):
+        return True
+    return error.pos >= len(buffer) - _TRUNCATED_TAIL
+
+
+def find_item_start(
+    file: BinaryIO, 
+    offset: int, 
+    key: str, 
+    window: int = SEARCH_WINDOW,
+) -> int | None:
+    """
+    Возвращает позицию в байтах начала объекта массива верхнего уровня,
+    первого после offset. Объект верхнего уровня отличается от вложенных
+    по наличию ключа key. Кандидат "{" внутри строки не декодируется в объект
+    с ключами, т.к. кавычки внутри строки экранированы
+    """
+    decoder = json.JSONDecoder()
+    while True:
+        file.seek(offset)
+        # Окно с запасом, чтобы объект-кандидат целиком попал в прочитанные данные
+        data = file.read(2 * window)
+        if not data:
+            return None
+
+        pos = data.find(b"{")
+        while pos != -1 and pos < window:
+            if _is_item_start(decoder, data, pos, key):
+                return offset + pos
+            pos = data.find(b"{", pos + 1)
+
+        if len(data) <= window:
+            return None
+        offset += window
+
+
+def _is_item_start(decoder: json.JSONDecoder, data: bytes, pos: int, key: str) -> bool:
+    before = data[max(0, pos - 256):pos].rstrip()
+    if not before or before[-1:] not in (b",", b"["):
+        return False
+    try:
+        item, _ = decoder.raw_decode(data[pos:].decode("utf-8", errors="ignore"))
+    except json.JSONDecodeError:
+        return False
+    return isinstance(item, dict) and key in item
+
+
+def find_array_end(file: BinaryIO, window: int = SEARCH_WINDOW) -> int:
+    """Возвращает позицию в байтах закрывающей скобки массива верхнего уровня"""
+    # mmap.seek, в отличие от файла, не возвращает позицию
+    file.seek(0, os.SEEK_END)
+    offset = file.tell()
+    while offset > 0:
+        offset = max(0, offset - window)
+        file.seek(offset)
+        pos = file.read(window).rfind(b"]")
+        if pos != -1:
+            return offset + pos
+    raise ValueError("JSON top-level value is not an array")
+
+
+@contextmanager
+def map_export(json_file: str) -> Iterator[mmap.mmap | bytes]:
+    """
+    Отображает файл выгрузки в память только для чтения. Данные берутся прямо
+    из страничного кэша ОС: файл не копируется в память процесса, а процессы,
+    отображающие один файл, разделяют одни и те же страницы
+    """
+    with open(json_file, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # Пустой файл нельзя отобразить, ошибку вернет декодер
+            yield b""
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def load_mapped(json_file: str) -> List[Dict]:
+    """
+    Декодирует выгрузку целиком из отображения файла в память, минуя чтение
+    файла в строку Python. Сборщик мусора на время декодирования отключается:
+    сотни тысяч создаваемых объектов не содержат циклических ссылок
+    """
+    with map_export(json_file) as mapped, memoryview(mapped) as view:
+        return _without_gc(ujson.loads, view)
+
+
+def load_projected(
+    json_file: str, 
+    fields: AbstractSet[str], 
+    key: str, 
+    chunk_size: int = PROJECTION_CHUNK_SIZE,
+) -> List[Dict]:
+    """
+    Декодирует выгрузку из отображения файла в память кусками по chunk_size байт
+    и оставляет в объектах верхнего уровня только поля fields. Неиспользуемые поля
+    каждого куска освобождаются сразу после декодирования, поэтому в памяти
+    одновременно полностью декодирован только один кусок.
+    Границы кусков ищутся, как границы шардов, по ключу key
+    """
+    return _without_gc(_load_projected, json_file, fields, key, chunk_size)
+
+
+def _load_projected(
+    json_file: str, 
+    fields: AbstractSet[str], 
+    key: str, 
+    chunk_size: int,
+) -> List[Dict]:
+    products: List[Dict] = []
+    with map_export(json_file) as mapped:
+        if not mapped:
+            raise ValueError("Empty export file")
+        start = find_item_start(mapped, 0, key)
+        if start is None:
+            # Пустой массив или не массив - ошибку, если она есть, вернет декодер
+            return ujson.loads(bytes(mapped))
+        end = find_array_end(mapped)
+        while start < end:
+            next_start = None
+            if start + chunk_size < end:
+                next_start = find_item_start(mapped, start + chunk_size, key)
+            if next_start is None or next_start > end:
+                next_start = end
+            products.extend(project(decode_span(mapped, start, next_start), fields))
+            start = next_start
+    return products
+
+
+def project(products: List[Dict], fields: AbstractSet[str]) -> List[Dict]:
+    """
+    Удаляет из товаров поля не из fields, вложенные объекты не меняются.
+    Удаление на месте быстрее построения новых словарей
+    """
+    for product in products:
+        for name in product.keys() - fields:
+            del product[name]
+    return products
+
+
+def decode_span(mapped: mmap.mmap | bytes, start: int, end: int) -> List[Dict]:
+    """
+    Декодирует объекты массива верхнего уровня между позициями start (начало объекта)
+    и end (начало следующего объекта или закрывающая скобка массива).
+    Из отображения копируется только сам кусок массива, без декодирования в строку
+    """
+    last = mapped.rfind(b"}", start, end)
+    if last == -1:
+        return []
+    with memoryview(mapped) as view, view[start:last + 1] as span:
+        data = b"".join((b"[", span, b"]"))
+    return _without_gc(ujson.loads, data)
+
+
+def _without_gc(decode, *args) -> List[Dict]:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return decode(*args)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
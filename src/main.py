@@ -1,42 +1,391 @@
+import asyncio
+import os
+import queue as queue_errors
+import time
+import traceback
+from dataclasses import dataclass
 from multiprocessing import Process, Queue
+from typing import Callable, Dict, Iterator, List
 
 from loguru import logger
+import ujson
 from pymongo.collection import Collection
 
 from settings import get_settings
 from db import get_db
 from json_parser import JsonParser
+from writers import BatchWriter, SyncWriter
+from async_writer import AsyncWriter, write_async
+from checkpoint import Checkpoint, CheckpointJournal, ResumeState
+from models import UNIQUE_ID_FIELD
+from delta import DeltaTracker, Snapshot, load_snapshot, save_snapshot, snapshot_from_export
+from indexes import ensure_indexes, product_indexes
+from sinks import FanOutSink, JsonlSink, MemorySink, NullSink, ParquetSink, Sink
+from metrics import Metrics
+from quarantine import JsonlQuarantine, MongoQuarantine, Quarantine
 
 
+# Файл выгрузки, директория с выгрузками или glob ("../exports/*.json").
+# Несколько выгрузок (по одной на склад) парсятся параллельно и объединяются в один каталог
 JSON_PATH = "../work.json"
 PRODUCTS_COLLECTION = "products"
+# Приемники товаров через запятую: mongo, jsonl, parquet, memory, null.
+# Задаются переменной окружения PRODUCTS_SINKS, например PRODUCTS_SINKS=mongo,parquet.
+# Несколько приемников получают каждый товар. null только считает товары -
+# для замера пропускной способности парсера без записи
+SINKS = os.getenv("PRODUCTS_SINKS", "mongo").split(",")
+JSONL_SINK_PATH = "../products.jsonl"
+# Нужен пакет pyarrow
+PARQUET_SINK_PATH = "../products.parquet"
+# Максимальное число товаров в очереди между парсером и записью в БД.
+# Если запись в БД не успевает, парсер блокируется на put
+QUEUE_MAXSIZE = 10_000
+# Количество товаров в одном insert_many
+BATCH_SIZE = 1000
+# При ORDERED_WRITES=True пачка пишется последовательно и останавливается на ошибке,
+# при False сервер пишет товары пачки в любом порядке, что быстрее
+ORDERED_WRITES = False
+# При ASYNC_WRITES=True товары пишутся через asyncio: следующие пачки отправляются,
+# не дожидаясь ответа сервера на предыдущие. Не используется в DELTA_MODE
+ASYNC_WRITES = False
+# Максимальное число пачек, записываемых одновременно при ASYNC_WRITES=True.
+# При ORDERED_WRITES=True пачки пишутся строго по очереди
+ASYNC_CONCURRENCY = 4
+# При SYNC_MODE=True товары не вставляются заново, а обновляются по ключу id+color,
+# неизменившиеся товары пропускаются. Позволяет повторно импортировать выгрузку
+# без удаления коллекции
+SYNC_MODE = False
+# При DELTA_MODE=True выгрузка сравнивается с предыдущей, в БД записываются
+# только добавленные, изменившиеся и удаленные товары (режим синхронизации)
+DELTA_MODE = False
+# Снимок предыдущей выгрузки, после импорта перезаписывается снимком текущей
+SNAPSHOT_PATH = "../snapshot.json"
+# Предыдущая выгрузка, из которой строится снимок, если файла снимка еще нет
+PREVIOUS_JSON_PATH: str | None = None
+# Изменения товаров с разницей остатков по размерам, по одному на строку
+DELTA_PATH = "../delta.jsonl"
+# Журнал контрольных точек импорта. После падения (например, потери соединения с БД)
+# повторный запуск продолжает импорт с последней точки, None - без контрольных точек.
+# Не используется в DELTA_MODE и при ASYNC_WRITES=True
+CHECKPOINT_PATH: str | None = "../checkpoint.jsonl"
+# Количество товаров между контрольными точками
+CHECKPOINT_INTERVAL = 10_000
+# Отклоненные товары (не удалось разобрать) с кодом причины, по одному на строку.
+# None - отклоненные товары только считаются
+QUARANTINE_PATH: str | None = "../rejected.jsonl"
+# Коллекция карантина в БД. Если задана, отклоненные товары пишутся в нее, а не в файл
+QUARANTINE_COLLECTION: str | None = None
+# При INDEXES_AFTER_LOAD=True индексы коллекции товаров строятся после записи всех товаров,
+# а не перед ней: при первой загрузке в пустую коллекцию так быстрее, чем обновлять
+# индексы на каждую вставку. Уникальный индекс по ключу id+color нужен только
+# при обновлении товаров (SYNC_MODE, DELTA_MODE, продолжение импорта) и создается сразу
+INDEXES_AFTER_LOAD = False
+# Файл с метриками этапов обработки, перезаписывается после каждого запуска
+METRICS_PATH = "../metrics.json"
+# Формат файла метрик: "json" или "prometheus"
+METRICS_FORMAT = "json"
+# Как часто, в секундах, запись проверяет, жив ли процесс парсера, пока очередь пуста.
+# Если парсер убит (OOM, SIGKILL), маркер конца потока не придет
+QUEUE_POLL_TIMEOUT = 5.0
 
 
-def main() -> None:
-    settings = get_settings()
-    db = get_db(settings)
-    logger.debug(db)
-    products_collection: Collection = db[PRODUCTS_COLLECTION]
-    logger.debug(products_collection)
-    queue = Queue()
+class ParserFailed(RuntimeError):
+    """Парсер не дошел до конца выгрузки: поток товаров неполный"""
 
-    parser = JsonParser(json_file=JSON_PATH, queue=queue)    
-    parser.run()
 
-    got_products = 0
+@dataclass
+class EndOfStream:
+    """
+    Маркер конца потока товаров, отправляется парсером после последнего товара.
+    Передает метрики процесса парсера и ошибку, если парсинг прервался
+    """
+    metrics: Metrics
+    error: str | None = None
+
+
+def produce(parser: JsonParser, queue: Queue) -> None:
+    """Процесс-производитель: парсит выгрузку и закрывает поток маркером"""
+    error = None
+    try:
+        parser.run()
+    except BaseException:
+        # Исключение передается текстом: не всякое исключение можно передать через очередь
+        error = traceback.format_exc()
+        raise
+    finally:
+        queue.put(EndOfStream(metrics=parser.metrics, error=error))
+
 
+def iter_queue(
+    queue: Queue, 
+    metrics: Metrics, 
+    on_checkpoint: Callable[[Checkpoint], None] | None = None,
+    producer: Process | None = None,
+) -> Iterator[Dict]:
+    """
+    Отдает товары из очереди до маркера конца потока. Парсер передает
+    компактные записи товаров, в документы БД они превращаются здесь.
+    Контрольные точки передаются в on_checkpoint.
+    Если парсер упал или процесс producer завершился без маркера, бросает ParserFailed
+    """
+    queue_stats = metrics.stage("queue_get")
+    while True:
+        start = time.perf_counter()
+        prod = get_from_queue(queue, producer)
+        if isinstance(prod, EndOfStream):
+            metrics.merge(prod.metrics)
+            if prod.error is not None:
+                raise ParserFailed(f"Parser failed, the product stream is incomplete:\n{prod.error}")
+            return
+        if isinstance(prod, Checkpoint):
+            if on_checkpoint is not None:
+                on_checkpoint(prod)
+            continue
+        queue_stats.add(time.perf_counter() - start)
+        yield prod.to_dict()
+
+
+def get_from_queue(queue: Queue, producer: Process | None) -> object:
+    """Ждет элемент очереди, пока жив процесс producer"""
+    if producer is None:
+        return queue.get()
     while True:
         try:
-            prod = queue.get(timeout=5)
-            products_collection.insert_one(prod)
+            return queue.get(timeout=QUEUE_POLL_TIMEOUT)
+        except queue_errors.Empty:
+            if producer.is_alive():
+                continue
+        # Процесс мог завершиться сразу после отправки последнего элемента
+        try:
+            return queue.get(timeout=QUEUE_POLL_TIMEOUT)
+        except queue_errors.Empty:
+            raise ParserFailed(
+                f"Parser process exited with code {producer.exitcode} "
+                "without finishing the product stream"
+            ) from None
+
+
+def load_previous_snapshot() -> Snapshot:
+    if os.path.exists(SNAPSHOT_PATH):
+        return load_snapshot(SNAPSHOT_PATH)
+    if PREVIOUS_JSON_PATH is not None:
+        return snapshot_from_export(PREVIOUS_JSON_PATH)
+    logger.warning("No previous snapshot found, all products are treated as added")
+    return {}
+
+
+def write_delta(products: Iterator[Dict], writer: SyncWriter) -> DeltaTracker:
+    """
+    Записывает в БД и в DELTA_PATH только изменения товаров
+    относительно предыдущей выгрузки. Удаленные товары ищутся только после
+    полного потока: если парсер упал, iter_queue бросает ParserFailed,
+    и товары, до которых парсер не дошел, не удаляются
+    """
+    tracker = DeltaTracker(previous=load_previous_snapshot())
+    with open(DELTA_PATH, "w") as delta_file:
+        for prod in products:
+            delta = tracker.add(prod)
+            if delta is None:
+                continue
+            delta_file.write(ujson.dumps(delta.to_dict(), ensure_ascii=False) + "\n")
+            writer.write(prod)
+
+        removed_ids = []
+        for delta in tracker.removed():
+            delta_file.write(ujson.dumps(delta.to_dict(), ensure_ascii=False) + "\n")
+            removed_ids.append(delta.unique_id)
+    writer.remove(removed_ids)
+    return tracker
+
+
+def write_with_checkpoints(
+    products: Callable[[Callable[[Checkpoint], None]], Iterator[Dict]],
+    writer: Sink,
+    journal: CheckpointJournal,
+    resume: ResumeState | None,
+    metrics: Metrics,
+) -> int:
+    """
+    Записывает товары и ведет журнал контрольных точек. На контрольной точке
+    недописанная пачка записывается, и после подтверждения сервером в журнал
+    попадают позиция во входном файле и ключи записанных товаров.
+    Товары, записанные до перезапуска, пропускаются
+    """
+    emitted = resume.emitted if resume is not None else set()
+    batches = resume.batches if resume is not None else 0
+    write_stats = metrics.stage("mongo_write")
+
+    def save_checkpoint(checkpoint: Checkpoint) -> None:
+        writer.flush()
+        journal.save(checkpoint.offset, batches=batches + write_stats.calls)
+
+    got_products = 0
+    for prod in products(save_checkpoint):
+        got_products += 1
+        unique_id = prod[UNIQUE_ID_FIELD]
+        if unique_id in emitted:
+            continue
+        writer.write(prod)
+        journal.add(unique_id)
+    return got_products
+
+
+def make_sink(names: List[str], metrics: Metrics, mongo_writer: Callable[[], BatchWriter]) -> Sink:
+    """Создает приемники по названиям, несколько приемников объединяются в FanOutSink"""
+    sinks: List[Sink] = []
+    for name in names:
+        if name == "mongo":
+            sinks.append(mongo_writer())
+        elif name == "jsonl":
+            sinks.append(JsonlSink(JSONL_SINK_PATH, batch_size=BATCH_SIZE, metrics=metrics))
+        elif name == "parquet":
+            sinks.append(ParquetSink(PARQUET_SINK_PATH, metrics=metrics))
+        elif name == "memory":
+            sinks.append(MemorySink())
+        elif name == "null":
+            sinks.append(NullSink())
+        else:
+            raise ValueError(f"Unknown sink {name!r}")
+    return sinks[0] if len(sinks) == 1 else FanOutSink(sinks)
+
+
+def write_products(
+    queue: Queue, 
+    metrics: Metrics, 
+    journal: CheckpointJournal | None = None,
+    resume: ResumeState | None = None,
+    producer: Process | None = None,
+) -> int:
+    """
+    Процесс-потребитель: записывает товары из очереди в приемники SINKS.
+    Если парсер упал, бросает ParserFailed до завершения записи
+    """
+    if DELTA_MODE and SINKS != ["mongo"]:
+        raise ValueError("DELTA_MODE supports only the mongo sink")
+    use_mongo = "mongo" in SINKS
+    # После перезапуска товары, записанные после последней контрольной точки,
+    # уже могут быть в БД, поэтому они обновляются, а не вставляются повторно
+    upsert = SYNC_MODE or DELTA_MODE or resume is not None
+    indexes = product_indexes(upsert)
+    products_collection: Collection | None = None
+    if use_mongo:
+        settings = get_settings()
+        db = get_db(settings)
+        logger.debug(db)
+        products_collection = db[PRODUCTS_COLLECTION]
+        logger.debug(products_collection)
+        if not INDEXES_AFTER_LOAD:
+            ensure_indexes(products_collection, metrics, indexes)
+
+    writer_cls = SyncWriter if upsert else BatchWriter
+    if ASYNC_WRITES and not DELTA_MODE and SINKS == ["mongo"]:
+        concurrency = 1 if ORDERED_WRITES else ASYNC_CONCURRENCY
+        async_writer = AsyncWriter(
+            writers=[
+                writer_cls(
+                    collection=products_collection, 
+                    batch_size=BATCH_SIZE, 
+                    ordered=ORDERED_WRITES,
+                )
+                for _ in range(concurrency)
+            ],
+            batch_size=BATCH_SIZE,
+            metrics=metrics,
+        )
+        got_products = asyncio.run(
+            write_async(iter_queue(queue, metrics, producer=producer), async_writer, queue_maxsize=QUEUE_MAXSIZE)
+        )
+        if INDEXES_AFTER_LOAD:
+            ensure_indexes(products_collection, metrics, indexes)
+        return got_products
+
+    writer = make_sink(
+        SINKS,
+        metrics,
+        mongo_writer=lambda: writer_cls(
+            collection=products_collection, 
+            batch_size=BATCH_SIZE, 
+            ordered=ORDERED_WRITES,
+            metrics=metrics,
+        ),
+    )
+    got_products = 0
+
+    if DELTA_MODE:
+        tracker = write_delta(iter_queue(queue, metrics, producer=producer), writer)
+        got_products = len(tracker.snapshot)
+    elif journal is not None:
+        got_products = write_with_checkpoints(
+            lambda on_checkpoint: iter_queue(queue, metrics, on_checkpoint, producer),
+            writer=writer,
+            journal=journal,
+            resume=resume,
+            metrics=metrics,
+        )
+    else:
+        for prod in iter_queue(queue, metrics, producer=producer):
+            writer.write(prod)
             got_products += 1
-        except:
-            logger.info(f"Successfully got products: {got_products}")
-            break
 
+    writer.close()
+    if use_mongo and INDEXES_AFTER_LOAD:
+        ensure_indexes(products_collection, metrics, indexes)
+    if DELTA_MODE:
+        # Снимок сохраняется только после записи изменений в БД
+        save_snapshot(SNAPSHOT_PATH, tracker.snapshot)
+    return got_products
 
-if __name__ == "__main__":
-    main()
 
+def get_quarantine() -> Quarantine:
+    if QUARANTINE_COLLECTION is not None:
+        return MongoQuarantine(get_settings(), QUARANTINE_COLLECTION)
+    if QUARANTINE_PATH is not None:
+        return JsonlQuarantine(QUARANTINE_PATH)
+    return Quarantine()
+
+
+def main() -> None:
+    journal = None
+    if CHECKPOINT_PATH is not None and not DELTA_MODE and not ASYNC_WRITES:
+        journal = CheckpointJournal(CHECKPOINT_PATH, JSON_PATH)
+    resume = journal.load() if journal is not None else None
+
+    queue = Queue(maxsize=QUEUE_MAXSIZE)
+    parser = JsonParser(
+        json_file=JSON_PATH, 
+        queue=queue,
+        quarantine=get_quarantine(),
+        checkpoint_interval=CHECKPOINT_INTERVAL if journal is not None else 0,
+        resume=resume,
+    )
+    parser_process = Process(target=produce, args=(parser, queue))
+    parser_process.start()
 
+    metrics = Metrics()
+    try:
+        got_products = write_products(
+            queue, 
+            metrics, 
+            journal=journal, 
+            resume=resume, 
+            producer=parser_process,
+        )
+    except BaseException:
+        # Иначе парсер останется висеть на put в заполненную очередь
+        parser_process.terminate()
+        raise
 
+    parser_process.join()
+    if parser_process.exitcode != 0:
+        logger.error(f"Parser process failed with exit code {parser_process.exitcode}")
+    elif journal is not None:
+        # Импорт завершен, следующий запуск начинается с начала выгрузки
+        journal.remove()
+    logger.info(f"Successfully got products: {got_products}")
+    logger.info(f"Index builds took {metrics.stage('index_build').seconds:.2f}s")
+    metrics.dump(METRICS_PATH, METRICS_FORMAT)
+    logger.info(f"Stage metrics written to {METRICS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
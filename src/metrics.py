@@ -0,0 +1,179 @@
+import random
+import time
+from array import array
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Dict, Iterable, Iterator, List
+
+import ujson
+
+
+# Максимальное число замеров длительности, хранимых на этап для расчета перцентилей.
+# Сверх этого замеры попадают в выборку случайно (reservoir sampling)
+RESERVOIR_SIZE = 100_000
+PROMETHEUS_PREFIX = "products_parser_stage"
+# Методы внутренних циклов (filter_id, parse_product, slugify, суммирование остатков
+# по записи) считают каждый вызов, а длительность замеряют у одного вызова из
+# TIMING_SAMPLE_RATE: два вызова perf_counter и обновление выборки на каждый вызов
+# заметно замедляют парсинг. 1 - замер каждого вызова, для профилирования.
+# Читается при импорте модулей парсера, когда применяются декораторы timed.
+# Этапы вложены: время parse_product включает slugify
+TIMING_SAMPLE_RATE = 64
+
+
+@dataclass
+class StageStats:
+    """Счетчики и замеры длительности одного этапа обработки"""
+    calls: int = 0
+    # Количество обработанных товаров, вызов может обрабатывать пачку
+    items: int = 0
+    seconds: float = 0.0
+    # Количество замеренных вызовов: при выборочном замере меньше calls
+    timed: int = 0
+    samples: array = field(default_factory=lambda: array("d"))
+
+    def count(self, items: int = 1) -> None:
+        """Учитывает вызов без замера длительности"""
+        self.calls += 1
+        self.items += items
+
+    def add(self, seconds: float, items: int = 1, weight: int = 1) -> None:
+        """
+        Учитывает замеренный вызов. weight - сколько вызовов представляет замер:
+        при замере одного вызова из N длительность остальных оценивается по нему
+        """
+        self.calls += 1
+        self.items += items
+        self.seconds += seconds * weight
+        self.timed += 1
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            idx = random.randrange(self.timed)
+            if idx < RESERVOIR_SIZE:
+                self.samples[idx] = seconds
+
+    def merge(self, other: "StageStats") -> None:
+        """Добавляет замеры этапа из другого процесса"""
+        total_calls = self.calls + other.calls
+        if total_calls and len(self.samples) + len(other.samples) > RESERVOIR_SIZE:
+            # Выборки берутся пропорционально числу вызовов
+            own = random.sample(
+                list(self.samples),
+                min(len(self.samples), RESERVOIR_SIZE * self.calls // total_calls),
+            )
+            others = random.sample(
+                list(other.samples),
+                min(len(other.samples), RESERVOIR_SIZE * other.calls // total_calls),
+            )
+            self.samples = array("d", own + others)
+        else:
+            self.samples.extend(other.samples)
+        self.calls = total_calls
+        self.items += other.items
+        self.seconds += other.seconds
+        self.timed += other.timed
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[round(q * (len(ordered) - 1))]
+
+    def report(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "items": self.items,
+            "seconds": self.seconds,
+            "items_per_second": self.items / self.seconds if self.seconds else 0.0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Metrics:
+    """Метрики этапов обработки выгрузки за один запуск"""
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageStats] = {}
+
+    def stage(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    def merge(self, other: "Metrics") -> None:
+        for name, stats in other.stages.items():
+            self.stage(name).merge(stats)
+
+    def report(self) -> Dict[str, Dict]:
+        return {name: stats.report() for name, stats in self.stages.items()}
+
+    def to_json(self) -> str:
+        return ujson.dumps(self.report(), indent=4)
+
+    def to_prometheus(self) -> str:
+        reports = self.report()
+        name = PROMETHEUS_PREFIX
+        lines: List[str] = []
+        for metric, metric_type, key in (
+            ("calls_total", "counter", "calls"),
+            ("items_total", "counter", "items"),
+            ("items_per_second", "gauge", "items_per_second"),
+        ):
+            lines.append(f"# TYPE {name}_{metric} {metric_type}")
+            for stage, report in reports.items():
+                lines.append(f'{name}_{metric}{{stage="{stage}"}} {report[key]}')
+
+        lines.append(f"# TYPE {name}_latency_seconds summary")
+        for stage, report in reports.items():
+            lines.extend((
+                f'{name}_latency_seconds{{stage="{stage}",quantile="0.5"}} {report["p50"]}',
+                f'{name}_latency_seconds{{stage="{stage}",quantile="0.99"}} {report["p99"]}',
+                f'{name}_latency_seconds_sum{{stage="{stage}"}} {report["seconds"]}',
+                f'{name}_latency_seconds_count{{stage="{stage}"}} {report["calls"]}',
+            ))
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, format: str) -> None:
+        """Записывает метрики в файл в формате "json" или "prometheus" """
+        text = self.to_prometheus() if format == "prometheus" else self.to_json()
+        with open(path, "w") as file:
+            file.write(text)
+
+
+def timed(stage: str, per_call: bool = True) -> Callable:
+    """
+    Декоратор метода: замеряет длительность вызова в self.metrics.
+    У методов, вызываемых на каждую запись (per_call=True), считается каждый вызов,
+    а замеряется один из TIMING_SAMPLE_RATE
+    """
+    def decorator(method: Callable) -> Callable:
+        every = TIMING_SAMPLE_RATE if per_call else 1
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.metrics.stage(stage)
+            if stats.calls % every:
+                stats.count()
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - start, weight=every)
+        return wrapper
+    return decorator
+
+
+def timed_iter(iterable: Iterable, stats: StageStats) -> Iterator:
+    """Замеряет время получения каждого элемента итератора, например декодирования товара"""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        stats.add(time.perf_counter() - start)
+        yield item
@@ -1,47 +1,162 @@
+import sys
+from array import array
 from dataclasses import dataclass
+from typing import Dict, List, Tuple
 
-from enums import Sex, Category, Country, BrandCode
+from enums import JSONFieldNames
 
 
-@dataclass
+# Поле товара в БД с естественным ключом id+color (см. JsonParser._get_unique_id)
+UNIQUE_ID_FIELD = "unique_id"
+# Ключи строки остатков в документе товара: значения Enum читаются один раз,
+# а не на каждую строку остатков
+LEFTOVER_SIZE = JSONFieldNames.size.value
+LEFTOVER_QUANTITY = JSONFieldNames.quantity.value
+LEFTOVER_PRICE = JSONFieldNames.price.value
+
+
+def intern(text: str) -> str:
+    """
+    Возвращает единственный экземпляр строки. Бренды, цвета, категории и размеры
+    повторяются в выгрузке тысячи раз, а декодер JSON создает новую строку на каждое вхождение
+    """
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+@dataclass(slots=True)
 class Brand:
-    _code: BrandCode
+    name: str
+    # Состоит из названия бренда, кода цвета, названия цвета и артикула
+    slug: str
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "slug": self.slug}
+
 
-    @property
-    def name(self) -> str:
-        return self._code.name
-    
-    @property
-    def slug(self) -> str:
-        return ...
+@dataclass(slots=True)
+class Category:
+    """Один объект на название категории, разделяется всеми товарами категории"""
+    name: str
+    slug: str
 
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "slug": self.slug}
 
-@dataclass
-class BaseProduct:
+
+@dataclass(slots=True)
+class Leftovers:
     """
-    Базовый класс продукта. 
-    Все продукты-наследники содержат его поля.
+    Остатки товара по размерам. Количества хранятся в массиве, а не в списке
+    словарей, цена одна на все размеры ("последняя цена побеждает").
+    Нецелые количества (например, 1.5) не помещаются в массив целых
+    и хранятся кортежем как есть
+    """
+    sizes: Tuple[str, ...]
+    counts: array | Tuple[int | float, ...]
+    price: int | None
+
+    @classmethod
+    def from_sizes(cls, sizes_to_quantity: Dict[str, int], price: int | None) -> "Leftovers":
+        try:
+            counts = array("q", sizes_to_quantity.values())
+        except (TypeError, OverflowError):
+            counts = tuple(sizes_to_quantity.values())
+        return cls(
+            sizes=tuple(intern(size) for size in sizes_to_quantity),
+            counts=counts,
+            price=price,
+        )
+
+    def to_list(self) -> List[Dict]:
+        price = self.price
+        return [
+            {LEFTOVER_SIZE: size, LEFTOVER_QUANTITY: quantity, LEFTOVER_PRICE: price}
+            for size, quantity in zip(self.sizes, self.counts)
+        ]
+
+
+@dataclass(slots=True)
+class Product:
+    """
+    Товар после parse_product, с которым работает парсер. В документ БД превращается
+    только на стороне записи, см. to_dict. Остатки заполняются при суммировании дубликатов
     """
     title: str
-    category: Category
-    vendor_code: str # Артикул
-    brand: int
-    sex: Sex
-    fashion_season: str
-    country: Country
+    sku: str
+    color: str
+    color_code: str
     brand: Brand
+    sex: str
+    root_category: Category
     price: int
     discount_price: int
     in_the_sale: bool
+    size_table_type: str
+    leftovers: Leftovers | None = None
+    # Естественный ключ id+color, см. JsonParser._get_unique_id
+    unique_id: str | None = None
 
+    def __reduce__(self):
+        # Товары передаются между процессами через очередь. Плоский кортеж
+        # сериализуется в разы быстрее вложенных записей и массива.
+        # Нецелые количества передаются кортежем, целые - списком
+        leftovers = self.leftovers
+        return (_restore_product, (
+            self.title, self.sku, self.color, self.color_code,
+            self.brand.name, self.brand.slug, self.sex,
+            self.root_category.name, self.root_category.slug,
+            self.price, self.discount_price, self.in_the_sale, self.size_table_type,
+            None if leftovers is None else leftovers.sizes,
+            None if leftovers is None else _dump_counts(leftovers.counts),
+            None if leftovers is None else leftovers.price,
+            self.unique_id,
+        ))
 
-@dataclass
-class PerfumeProduct(BaseProduct):
-    ...
+    def to_dict(self) -> Dict:
+        """Возвращает документ товара для записи в БД"""
+        product = {
+            "title": self.title,
+            "sku": self.sku,
+            "color": self.color,
+            "color_code": self.color_code,
+            "brand": self.brand.to_dict(),
+            "sex": self.sex,
+            "root_category": self.root_category.to_dict(),
+            "price": self.price,
+            "discount_price": self.discount_price,
+            "in_the_sale": self.in_the_sale,
+            "size_table_type": self.size_table_type,
+            "leftovers": self.leftovers.to_list() if self.leftovers is not None else [],
+        }
+        if self.unique_id is not None:
+            product[UNIQUE_ID_FIELD] = self.unique_id
+        return product
 
 
-@dataclass
-class ClothingProduct(BaseProduct):
-    material: str
-    color: int
-    color_code: str
+def _dump_counts(counts: array | Tuple) -> List | Tuple:
+    return counts.tolist() if isinstance(counts, array) else counts
+
+
+def _restore_product(
+    title, sku, color, color_code, brand_name, brand_slug, sex, category_name, category_slug,
+    price, discount_price, in_the_sale, size_table_type, sizes, counts, leftovers_price, unique_id,
+) -> Product:
+    return Product(
+        title=title,
+        sku=sku,
+        color=intern(color),
+        color_code=intern(color_code),
+        brand=Brand(name=intern(brand_name), slug=brand_slug),
+        sex=sex,
+        root_category=Category(name=intern(category_name), slug=category_slug),
+        price=price,
+        discount_price=discount_price,
+        in_the_sale=in_the_sale,
+        size_table_type=intern(size_table_type),
+        leftovers=None if sizes is None else Leftovers(
+            sizes=tuple(intern(size) for size in sizes),
+            counts=counts if isinstance(counts, tuple) else array("q", counts),
+            price=leftovers_price,
+        ),
+        unique_id=unique_id,
+    )
@@ -0,0 +1,124 @@
+import hashlib
+import importlib.util
+import os
+import pickle
+import time
+from functools import lru_cache
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import ujson
+from loguru import logger
+
+from models import Product
+from metrics import StageStats
+from quarantine import Quarantine
+
+
+# Версия формата кэша, меняется вместе с полями Product и записями карантина
+CACHE_VERSION = 3
+# Модули, от кода которых зависит результат парсинга. Хэш их исходников входит
+# в ключ кэша: после изменения логики парсинга кэш не используется
+PARSER_MODULES = (
+    "json_parser", 
+    "consolidation", 
+    "models", 
+    "enums", 
+    "field_plan", 
+    "slugs", 
+    "sharding", 
+    "external_sort",
+    "json_stream",
+)
+# Количество товаров в одном кадре pickle: кадр десериализуется одним вызовом
+FRAME_SIZE = 1000
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class ParseCache:
+    """
+    Кэш результата парсинга на диске: поток сведенных и нормализованных товаров,
+    записанный кадрами pickle (товары сериализуются плоскими кортежами).
+    Ключ - хэш содержимого выгрузки и настроек парсера, поэтому повторный запуск
+    по той же выгрузке пропускает декодирование JSON, parse_product и slugify.
+    Последний кадр - записи карантина: при чтении из кэша они передаются в карантин снова
+    """
+    def __init__(self, directory: str, key: str) -> None:
+        self.path = os.path.join(directory, f"{key}.pickle")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read(
+        self, 
+        stats: StageStats | None = None, 
+        quarantine: Quarantine | None = None,
+    ) -> Iterator[Product]:
+        logger.info(f"Reading parsed products from cache {self.path}")
+        with open(self.path, "rb") as file:
+            while True:
+                start = time.perf_counter()
+                try:
+                    frame: List[Product] | Tuple[str, List[Dict]] = pickle.load(file)
+                except EOFError:
+                    return
+                if isinstance(frame, tuple):
+                    _, rejected = frame
+                    if quarantine is not None:
+                        quarantine.extend(rejected)
+                    continue
+                if stats is not None:
+                    stats.add(time.perf_counter() - start, items=len(frame))
+                yield from frame
+
+    def write(
+        self, 
+        products: Iterable[Product], 
+        rejected: List[Dict] | None = None,
+    ) -> Iterator[Product]:
+        """
+        Отдает товары дальше, попутно записывая их в кэш. Кэш появляется только
+        после того, как отданы все товары: прерванный парсинг не оставляет
+        неполный кэш. rejected - записи карантина, накопленные за парсинг
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                products = iter(products)
+                while frame := list(islice(products, FRAME_SIZE)):
+                    pickle.dump(frame, file, protocol=pickle.HIGHEST_PROTOCOL)
+                    yield from frame
+                pickle.dump(("rejected", rejected or []), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            logger.info(f"Parsed products saved to cache {self.path}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+@lru_cache(maxsize=None)
+def code_version(modules: Tuple[str, ...] = PARSER_MODULES) -> str:
+    """Хэш исходного кода модулей парсера"""
+    digest = hashlib.sha256()
+    for module in modules:
+        with open(importlib.util.find_spec(module).origin, "rb") as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+def cache_key(json_files: List[str], config: Dict) -> str:
+    """Хэш содержимого файлов выгрузки и настроек парсера"""
+    digest = hashlib.sha256()
+    digest.update(ujson.dumps(
+        {"version": CACHE_VERSION, "code": code_version(), "config": config},
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode())
+    for json_file in json_files:
+        with open(json_file, "rb") as file:
+            while chunk := file.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+        # Граница файлов: склейка тех же байтов по-другому дает другой ключ
+        digest.update(f"\0{os.path.getsize(json_file)}\0".encode())
+    return digest.hexdigest()
@@ -0,0 +1,129 @@
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from loguru import logger
+import ujson
+
+from db import get_db
+from enums import RejectReason
+from settings import Settings
+
+
+# Количество отклоненных товаров в одной записи в карантин
+QUARANTINE_BATCH_SIZE = 1000
+
+
+class Quarantine:
+    """
+    Карантин отклоненных товаров: товары, которые не удалось разобрать, копятся
+    и записываются пачками вместе с кодом причины. В лог попадают только
+    количества по причинам. Базовый класс только считает отклоненные товары.
+    Каждая запись помечена идентификатором запуска run_id и временем отклонения:
+    записи разных запусков в одном файле или коллекции можно отличить
+    """
+    def __init__(self, batch_size: int = QUARANTINE_BATCH_SIZE) -> None:
+        self.run_id = uuid.uuid4().hex
+        self._batch_size = batch_size
+        self._batch: List[Dict] = []
+        self.counts: Counter[str] = Counter()
+        self._recorded: List[Dict] | None = None
+
+    def reject(self, product: Dict, reason: RejectReason) -> None:
+        self.add({
+            "reason": reason.value, 
+            "product": product, 
+            "rejected_at": datetime.now(timezone.utc).isoformat(),
+        })
+
+    def record(self) -> List[Dict]:
+        """
+        Начинает копить все последующие записи карантина в возвращаемом списке,
+        например, для кэша результатов парсинга
+        """
+        self._recorded = []
+        return self._recorded
+
+    def add(self, record: Dict) -> None:
+        # Записи процессов пула и кэша парсинга относятся к текущему запуску
+        record["run_id"] = self.run_id
+        self.counts[record["reason"]] += 1
+        if self._recorded is not None:
+            # Копия: insert_many дописывает _id прямо в переданные записи,
+            # и повторная вставка тех же записей из кэша упала бы на дубликате ключа
+            self._recorded.append(dict(record))
+        self._batch.append(record)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def extend(self, records: Iterable[Dict]) -> None:
+        """Добавляет записи карантина другого процесса"""
+        for record in records:
+            self.add(record)
+
+    def flush(self) -> None:
+        batch = self._batch
+        self._batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self) -> None:
+        self.flush()
+        if self.counts:
+            summary = ", ".join(f"{reason}: {count}" for reason, count in self.counts.items())
+            logger.warning(f"Rejected products: {sum(self.counts.values())} ({summary})")
+
+    def _write(self, batch: List[Dict]) -> None:
+        pass
+
+
+class MemoryQuarantine(Quarantine):
+    """Хранит отклоненные товары в памяти, например, в процессе пула до передачи в основной"""
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: List[Dict] = []
+
+    def _write(self, batch: List[Dict]) -> None:
+        self.records.extend(batch)
+
+
+class JsonlQuarantine(Quarantine):
+    """Дописывает отклоненные товары в jsonl-файл, по одному на строку"""
+    def __init__(self, path: str, batch_size: int = QUARANTINE_BATCH_SIZE) -> None:
+        super().__init__(batch_size)
+        self._path = path
+
+    def _write(self, batch: List[Dict]) -> None:
+        os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        with open(self._path, "a", encoding="utf-8") as file:
+            file.write("".join(ujson.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+
+
+class MongoQuarantine(Quarantine):
+    """
+    Записывает отклоненные товары в коллекцию карантина через insert_many.
+    Соединение открывается при первой записи - уже в процессе парсера
+    """
+    def __init__(
+        self,
+        settings: Settings,
+        collection: str,
+        batch_size: int = QUARANTINE_BATCH_SIZE,
+    ) -> None:
+        super().__init__(batch_size)
+        self._settings = settings
+        self._collection_name = collection
+        self._collection = None
+
+    def _write(self, batch: List[Dict]) -> None:
+        if self._collection is None:
+            self._collection = get_db(self._settings)[self._collection_name]
+        self._collection.insert_many(batch, ordered=False)
+
+    def __getstate__(self) -> Dict:
+        # Клиент Mongo не передается в другой процесс
+        state = self.__dict__.copy()
+        state["_collection"] = None
+        return state
@@ -0,0 +1,254 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from enums import JSONFieldNames
+from consolidation import LeftoversSum, ProductGroup
+from models import Product
+from json_stream import decode_span, find_array_end, find_item_start, map_export
+from metrics import Metrics
+from quarantine import MemoryQuarantine, Quarantine
+
+
+# Количество шардов на один процесс: шардов больше, чем процессов,
+# чтобы процессы, получившие быстрые шарды, не простаивали
+SHARDS_PER_WORKER = 4
+
+
+@dataclass
+class ShardGroup:
+    """
+    Группа дубликатов внутри одного шарда. Остатки записей до головной записи
+    шарда хранятся отдельно: они учитываются, только если головная запись группы
+    нашлась в одном из предыдущих шардов
+    """
+    unique_id: str
+    # Индекс головной записи внутри шарда
+    head_idx: int = -1
+    group: ProductGroup | None = None
+    pre_leftovers: LeftoversSum = field(default_factory=LeftoversSum)
+
+    def dump(self) -> "ShardResult":
+        """
+        Возвращает группу в виде кортежа: кортежи передаются между процессами
+        в разы быстрее датаклассов
+        """
+        pre = self.pre_leftovers
+        if self.group is None:
+            return (self.unique_id, None, {}, None, pre.sizes_to_quantity, pre.price)
+        leftovers = self.group.leftovers
+        return (
+            self.unique_id,
+            self.group.product,
+            leftovers.sizes_to_quantity,
+            leftovers.price,
+            pre.sizes_to_quantity,
+            pre.price,
+        )
+
+
+# (unique_id, головной товар шарда, остатки от головной записи, их цена,
+#  остатки до головной записи, их цена)
+ShardResult = Tuple[str, Product | None, Dict[str, int], int | None, Dict[str, int], int | None]
+# (unique_id, запись карантина) - запись, отклоненная до головной записи группы в шарде
+ShardRejection = Tuple[str, Dict]
+
+
+def export_files(json_path: str) -> List[str]:
+    """
+    Возвращает файлы выгрузок по пути: файл, директория с .json-файлами
+    или glob (например "../exports/*.json"). Порядок файлов - по имени
+    """
+    if os.path.isdir(json_path):
+        return sorted(glob.glob(os.path.join(json_path, "*.json")))
+    if glob.has_magic(json_path):
+        return sorted(glob.glob(json_path))
+    return [json_path]
+
+
+def split_export(json_file: str, shards: int) -> List[Tuple[int, int]]:
+    """
+    Делит массив товаров выгрузки на shards кусков примерно равного размера
+    по границам объектов верхнего уровня. Возвращает (начало, конец) в байтах
+    """
+    key = JSONFieldNames.id.value
+    size = os.path.getsize(json_file)
+    # Границы ищутся прямо в отображении файла, без чтения окон в память процесса
+    with map_export(json_file) as mapped:
+        if not mapped:
+            return []
+        first = find_item_start(mapped, 0, key)
+        if first is None:
+            return []
+        end = find_array_end(mapped)
+
+        starts = [first]
+        for shard_idx in range(1, shards):
+            start = find_item_start(mapped, max(first, size * shard_idx // shards), key)
+            if start is not None and starts[-1] < start < end:
+                starts.append(start)
+
+    return list(zip(starts, starts[1:] + [end]))
+
+
+def consolidate_shard(
+    json_file: str, 
+    span: Tuple[int, int],
+    projected: bool = False,
+) -> Tuple[List[ShardResult], Metrics, List[ShardRejection]]:
+    """
+    Парсит товары одного шарда и суммирует остатки дубликатов внутри него.
+    Выполняется в процессе пула, вместе с группами возвращает метрики процесса
+    и отклоненные товары. Попадут ли они в карантин, решает merge_shards
+    """
+    # json_parser импортирует этот модуль
+    from json_parser import JsonParser
+
+    quarantine = MemoryQuarantine()
+    parser = JsonParser(
+        json_file=json_file, 
+        queue=None, 
+        workers=1, 
+        quarantine=quarantine,
+        projected=projected,
+    )
+    start, end = span
+    decode_start = time.perf_counter()
+    # Процессы пула отображают один и тот же файл и разделяют его страницы в кэше ОС
+    with map_export(json_file) as mapped:
+        products = parser.project(decode_span(mapped, start, end))
+    parser.metrics.stage("json_decode").add(
+        time.perf_counter() - decode_start, 
+        items=len(products),
+    )
+
+    fields = parser.fields
+    groups: Dict[str, ShardGroup] = {}
+    rejected: List[ShardRejection] = []
+    for product_idx, product in enumerate(products):
+        sku, raw_color = fields.id_and_color(product)
+        filtered_id = parser.filter_id(sku)
+        unique_id = parser._get_unique_id(filtered_id, raw_color)
+
+        shard_group = groups.get(unique_id)
+        if shard_group is None:
+            shard_group = groups[unique_id] = ShardGroup(unique_id=unique_id)
+        if shard_group.group is not None:
+            shard_group.group.add_leftovers(product[fields.leftovers], fields)
+            continue
+
+        parsed_prod = parser.parse_product(product, filtered_id)
+        if parsed_prod is None:
+            # Отклоненная запись может быть и без остатков: тогда учитывать нечего
+            shard_group.pre_leftovers.add(product.get(fields.leftovers), fields.leftover_row)
+            # Записи отклоняются редко, поэтому карантин сбрасывается на каждой
+            quarantine.flush()
+            rejected.extend((unique_id, record) for record in quarantine.records)
+            quarantine.records.clear()
+            continue
+
+        shard_group.head_idx = product_idx
+        shard_group.group = ProductGroup(unique_id=unique_id, product=parsed_prod)
+        shard_group.group.add_leftovers(product[fields.leftovers], fields)
+
+    shard_groups = sorted(groups.values(), key=lambda shard_group: shard_group.head_idx)
+    return [shard_group.dump() for shard_group in shard_groups], parser.metrics, rejected
+
+
+def merge_shards(
+    shards: Iterable[Tuple[List[ShardResult], List[ShardRejection]]],
+    quarantine: Quarantine | None = None,
+) -> Iterator[Product]:
+    """
+    Объединяет группы шардов в порядке шардов. Результат совпадает
+    с Consolidator(sequential=False) на всей выгрузке. Запись, отклоненная в шарде,
+    попадает в quarantine, только если ни один из предыдущих шардов не нашел
+    головную запись ее группы: иначе в одном процессе она была бы дубликатом
+    """
+    groups: Dict[str, ProductGroup] = {}
+    for shard, rejected in shards:
+        if quarantine is not None:
+            quarantine.extend(record for unique_id, record in rejected if unique_id not in groups)
+        for unique_id, product, sizes, price, pre_sizes, pre_price in shard:
+            group = groups.get(unique_id)
+            if group is not None:
+                group.leftovers.merge(LeftoversSum(pre_sizes, pre_price))
+                group.leftovers.merge(LeftoversSum(sizes, price))
+            elif product is not None:
+                groups[unique_id] = ProductGroup(
+                    unique_id=unique_id, 
+                    product=product, 
+                    leftovers=LeftoversSum(sizes, price),
+                )
+
+    for group in groups.values():
+        yield group.build()
+
+
+def consolidate_sharded(
+    json_file: str, 
+    workers: int, 
+    metrics: Metrics, 
+    shards: int | None = None,
+    quarantine: Quarantine | None = None,
+    projected: bool = False,
+) -> Iterator[Product]:
+    """
+    Параллельно парсит выгрузку по шардам в пуле процессов и объединяет результат.
+    Метрики процессов пула добавляются в metrics, отклоненные товары - в quarantine
+    """
+    spans = split_export(json_file, shards or workers * SHARDS_PER_WORKER)
+    yield from _consolidate_shards(
+        [json_file] * len(spans), 
+        spans, 
+        workers, 
+        metrics, 
+        quarantine,
+        projected,
+    )
+
+
+def consolidate_files(
+    json_files: List[str], 
+    workers: int, 
+    metrics: Metrics,
+    quarantine: Quarantine | None = None,
+    projected: bool = False,
+) -> Iterator[Product]:
+    """
+    Параллельно парсит несколько выгрузок (например, по одной на склад) и объединяет
+    их в один каталог: остатки товара с одинаковыми id+color суммируются по всем файлам.
+    Файлы делятся на шарды так, чтобы шардов было не меньше workers * SHARDS_PER_WORKER
+    """
+    shards_per_file = max(1, workers * SHARDS_PER_WORKER // len(json_files))
+    files, spans = [], []
+    for json_file in json_files:
+        file_spans = split_export(json_file, shards_per_file)
+        files.extend([json_file] * len(file_spans))
+        spans.extend(file_spans)
+    yield from _consolidate_shards(files, spans, workers, metrics, quarantine, projected)
+
+
+def _consolidate_shards(
+    json_files: List[str],
+    spans: List[Tuple[int, int]],
+    workers: int,
+    metrics: Metrics,
+    quarantine: Quarantine | None,
+    projected: bool,
+) -> Iterator[Product]:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shard_results = []
+        shards = executor.map(consolidate_shard, json_files, spans, repeat(projected))
+        for shard_groups, shard_metrics, rejected in shards:
+            metrics.merge(shard_metrics)
+            shard_results.append((shard_groups, rejected))
+
+    start = time.perf_counter()
+    products = list(merge_shards(shard_results, quarantine))
+    metrics.stage("consolidate").add(time.perf_counter() - start, items=len(products))
+    yield from products
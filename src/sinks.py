@@ -0,0 +1,199 @@
+import time
+from typing import Dict, List
+
+from loguru import logger
+import ujson
+
+from metrics import Metrics
+from models import Product
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# Количество товаров в одной группе строк parquet-файла
+PARQUET_ROW_GROUP_SIZE = 100_000
+
+
+class Sink:
+    """
+    Приемник документов товаров: коллекция БД, файл или память.
+    Документ может быть изменен приемником (например, insert_many добавляет _id)
+    """
+    written = 0
+
+    def write(self, product: Dict) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Записывает накопленные товары"""
+
+    def close(self) -> None:
+        self.flush()
+
+
+class BufferedSink(Sink):
+    """Копит товары и записывает их пачками, время записи пачек - этап метрик stage"""
+    stage = "sink_write"
+
+    def __init__(self, batch_size: int, metrics: Metrics | None = None) -> None:
+        self._batch_size = batch_size
+        self._batch: List[Dict] = []
+        self.metrics = metrics or Metrics()
+        self.written = 0
+        self._start = time.perf_counter()
+
+    def write(self, product: Dict) -> None:
+        self._batch.append(product)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        batch = self._batch
+        self._batch = []
+        if not batch:
+            return
+        start = time.perf_counter()
+        self._write_batch(batch)
+        self.written += len(batch)
+        self.metrics.stage(self.stage).add(time.perf_counter() - start, items=len(batch))
+
+    def close(self) -> None:
+        self.flush()
+        elapsed = time.perf_counter() - self._start
+        rate = self.written / elapsed if elapsed else 0
+        logger.info(f"{type(self).__name__}: written products: {self.written}, {rate:.0f} docs/s")
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        raise NotImplementedError
+
+
+class JsonlSink(BufferedSink):
+    """Записывает товары в jsonl-файл, по одному на строку"""
+    stage = "jsonl_write"
+
+    def __init__(self, path: str, batch_size: int, metrics: Metrics | None = None) -> None:
+        super().__init__(batch_size, metrics)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def close(self) -> None:
+        super().close()
+        self._file.close()
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        dumps = ujson.dumps
+        self._file.write("".join([dumps(product, ensure_ascii=False) + "\n" for product in batch]))
+
+
+class ParquetSink(BufferedSink):
+    """
+    Записывает товары в parquet-файл для аналитики: одна группа строк на пачку.
+    Бренд и категория - структуры, остатки - список структур. Нужен пакет pyarrow
+    """
+    stage = "parquet_write"
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = PARQUET_ROW_GROUP_SIZE,
+        metrics: Metrics | None = None,
+    ) -> None:
+        if pa is None:
+            raise RuntimeError("Parquet sink requires pyarrow: pip install pyarrow")
+        super().__init__(batch_size, metrics)
+        self._schema = parquet_schema()
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def close(self) -> None:
+        super().close()
+        self._writer.close()
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        # Поля вне схемы (_id, content_hash) не записываются
+        self._writer.write_table(pa.Table.from_pylist(batch, schema=self._schema))
+
+
+def parquet_schema() -> "pa.Schema":
+    named = pa.struct([("name", pa.string()), ("slug", pa.string())])
+    leftover = pa.struct([("size", pa.string()), ("count", pa.int64()), ("price", pa.float64())])
+    return pa.schema([
+        ("title", pa.string()),
+        ("sku", pa.string()),
+        ("color", pa.string()),
+        ("color_code", pa.string()),
+        ("brand", named),
+        ("sex", pa.string()),
+        ("root_category", named),
+        ("price", pa.float64()),
+        ("discount_price", pa.float64()),
+        ("in_the_sale", pa.bool_()),
+        ("size_table_type", pa.string()),
+        ("leftovers", pa.list_(leftover)),
+        ("unique_id", pa.string()),
+    ])
+
+
+class MemorySink(Sink):
+    """Хранит товары в памяти, например, для тестов"""
+    def __init__(self) -> None:
+        self.products: List[Dict] = []
+
+    @property
+    def written(self) -> int:
+        return len(self.products)
+
+    def write(self, product: Dict) -> None:
+        self.products.append(product)
+
+
+class NullSink(Sink):
+    """Только считает товары: пропускная способность парсера без затрат на запись"""
+    def __init__(self) -> None:
+        self.written = 0
+
+    def write(self, product: Dict) -> None:
+        self.written += 1
+
+    def close(self) -> None:
+        logger.info(f"NullSink: discarded products: {self.written}")
+
+
+class SinkQueue:
+    """
+    Передает товары парсера прямо в приемник вместо multiprocessing.Queue,
+    в том же процессе: например, в бенчмарках парсера с NullSink
+    """
+    def __init__(self, sink: Sink) -> None:
+        self.sink = sink
+
+    def put(self, product: Product) -> None:
+        self.sink.write(product.to_dict())
+
+
+class FanOutSink(Sink):
+    """
+    Записывает каждый товар в несколько приемников. Каждый приемник, кроме первого,
+    получает свою копию документа: приемники добавляют в документ служебные поля
+    """
+    def __init__(self, sinks: List[Sink]) -> None:
+        self.sinks = sinks
+
+    @property
+    def written(self) -> int:
+        return min(sink.written for sink in self.sinks)
+
+    def write(self, product: Dict) -> None:
+        for sink in self.sinks[1:]:
+            sink.write(dict(product))
+        self.sinks[0].write(product)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
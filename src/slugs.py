@@ -0,0 +1,25 @@
+from functools import lru_cache
+
+from slugify import slugify
+
+
+# Максимальное число закэшированных slug. Категорий - десятки, брендов и цветов - сотни
+SLUG_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=SLUG_CACHE_SIZE)
+def cached_slugify(text: str) -> str:
+    """
+    slugify с кэшем для повторяющихся значений: категорий, брендов, цветов.
+    Счетчики попаданий и промахов - cached_slugify.cache_info()
+    """
+    return slugify(text)
+
+
+def join_slugs(*slugs: str) -> str:
+    """
+    Склеивает slug частей через "-". Результат совпадает со slugify от частей,
+    склеенных через разделитель, который slugify заменяет на "-" (например "+"),
+    т.к. транслитерация и замена символов не выходят за границы частей
+    """
+    return "-".join(slug for slug in slugs if slug)
@@ -0,0 +1,187 @@
+import hashlib
+import time
+from typing import Dict, List
+
+from loguru import logger
+import ujson
+from pymongo import ReplaceOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from models import UNIQUE_ID_FIELD
+from indexes import UNIQUE_ID_INDEX, ensure_indexes
+from metrics import Metrics
+from sinks import Sink
+
+
+# Поле товара в БД с хэшем его содержимого
+CONTENT_HASH_FIELD = "content_hash"
+# Код ошибки записи документа с уже существующим значением уникального индекса
+DUPLICATE_KEY_ERROR = 11000
+
+
+class BatchWriter(Sink):
+    """
+    Копит товары и записывает их в коллекцию пачками через insert_many,
+    вместо отдельного запроса на каждый товар
+    """
+    def __init__(
+        self,
+        collection: Collection,
+        batch_size: int,
+        ordered: bool,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self._collection = collection
+        self._batch_size = batch_size
+        self._ordered = ordered
+        self._batch: List[Dict] = []
+        self.metrics = metrics or Metrics()
+
+        self.written = 0
+        self.failed = 0
+        # Товары, отклоненные уникальным индексом: уже есть в коллекции
+        self.duplicates = 0
+        self._start = time.perf_counter()
+
+    def write(self, product: Dict) -> None:
+        self._batch.append(product)
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        batch = self._batch
+        self._batch = []
+        self.write_batch(batch)
+
+    def write_batch(self, batch: List[Dict]) -> None:
+        """Записывает готовую пачку товаров"""
+        if not batch:
+            return
+
+        start = time.perf_counter()
+        items = len(batch)
+        while batch:
+            batch = self._insert(batch)
+        self.metrics.stage("mongo_write").add(time.perf_counter() - start, items=items)
+
+    def close(self) -> None:
+        self.flush()
+        elapsed = time.perf_counter() - self._start
+        rate = self.written / elapsed if elapsed else 0
+        logger.info(
+            f"Written products: {self.written}, failed: {self.failed}, "
+            f"{rate:.0f} docs/s"
+        )
+        if self.duplicates:
+            logger.warning(
+                f"Products already in the collection: {self.duplicates}, "
+                "use SYNC_MODE to update them"
+            )
+
+    def _insert(self, batch: List[Dict]) -> List[Dict]:
+        """
+        Записывает пачку, возвращает товары, которые нужно записать повторно.
+        При ordered=True сервер прекращает запись на первой ошибке,
+        поэтому товары после ошибочного возвращаются на повторную запись
+        """
+        try:
+            self._collection.insert_many(batch, ordered=self._ordered)
+        except BulkWriteError as e:
+            self.written += e.details["nInserted"]
+            return self._handle_write_errors(e, batch)
+
+        self.written += len(batch)
+        return []
+
+    def _handle_write_errors(self, e: BulkWriteError, batch: List[Dict]) -> List[Dict]:
+        write_errors = e.details["writeErrors"]
+        self.failed += len(write_errors)
+        for error in write_errors:
+            if error.get("code") == DUPLICATE_KEY_ERROR:
+                # Повторный импорт в заполненную коллекцию - одна строка лога в итогах
+                self.duplicates += 1
+                continue
+            product = batch[error["index"]]
+            logger.warning(
+                f"Failed to write product {product.get('sku')}: {error['errmsg']}"
+            )
+        if self._ordered:
+            return batch[write_errors[-1]["index"] + 1:]
+        return []
+
+
+class SyncWriter(BatchWriter):
+    """
+    Синхронизирует товары с коллекцией: upsert по естественному ключу id+color.
+    Вместе с товаром хранится хэш его содержимого, товары с неизменившимся
+    хэшем не перезаписываются, поэтому повторный импорт выгрузки идемпотентен
+    """
+    def __init__(
+        self,
+        collection: Collection,
+        batch_size: int,
+        ordered: bool,
+        metrics: Metrics | None = None,
+    ) -> None:
+        super().__init__(collection, batch_size, ordered, metrics)
+        self.skipped = 0
+        self.removed = 0
+        # Без индекса поиск хэшей и upsert по ключу сканируют всю коллекцию
+        ensure_indexes(self._collection, self.metrics, [UNIQUE_ID_INDEX])
+
+    def close(self) -> None:
+        super().close()
+        logger.info(f"Unchanged products skipped: {self.skipped}, removed: {self.removed}")
+
+    def remove(self, unique_ids: List[str]) -> None:
+        """Удаляет товары по ключам id+color"""
+        for start in range(0, len(unique_ids), self._batch_size):
+            result = self._collection.delete_many(
+                {UNIQUE_ID_FIELD: {"$in": unique_ids[start:start + self._batch_size]}}
+            )
+            self.removed += result.deleted_count
+
+    def _insert(self, batch: List[Dict]) -> List[Dict]:
+        for product in batch:
+            product[CONTENT_HASH_FIELD] = content_hash(product)
+
+        stored_hashes = {
+            doc[UNIQUE_ID_FIELD]: doc.get(CONTENT_HASH_FIELD)
+            for doc in self._collection.find(
+                {UNIQUE_ID_FIELD: {"$in": [p[UNIQUE_ID_FIELD] for p in batch]}},
+                {UNIQUE_ID_FIELD: 1, CONTENT_HASH_FIELD: 1, "_id": 0},
+            )
+        }
+        changed = [
+            product for product in batch
+            if stored_hashes.get(product[UNIQUE_ID_FIELD]) != product[CONTENT_HASH_FIELD]
+        ]
+        self.skipped += len(batch) - len(changed)
+        if not changed:
+            return []
+
+        requests = [
+            ReplaceOne({UNIQUE_ID_FIELD: product[UNIQUE_ID_FIELD]}, product, upsert=True)
+            for product in changed
+        ]
+        try:
+            self._collection.bulk_write(requests, ordered=self._ordered)
+        except BulkWriteError as e:
+            self.written += e.details["nUpserted"] + e.details["nMatched"]
+            return self._handle_write_errors(e, changed)
+
+        self.written += len(changed)
+        return []
+
+
+def content_hash(product: Dict) -> str:
+    """Хэш содержимого товара без служебных полей БД"""
+    content = {
+        key: value for key, value in product.items()
+        if key not in ("_id", CONTENT_HASH_FIELD)
+    }
+    return hashlib.blake2b(
+        ujson.dumps(content, sort_keys=True, ensure_ascii=False).encode(),
+        digest_size=16,
+    ).hexdigest()
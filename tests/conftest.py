@@ -0,0 +1,80 @@
+import random
+from typing import Callable, Dict, List
+
+import pytest
+import ujson
+
+from src.json_parser import Checkpoint, JsonParser
+
+
+class ListQueue(list):
+    """Заменяет multiprocessing.Queue и запись в БД в тестах"""
+    def put(self, item) -> None:
+        self.append(item.to_dict())
+
+
+class RecordQueue(list):
+    """Очередь товаров и контрольных точек, товары превращаются в документы БД"""
+    def put(self, item) -> None:
+        self.append(item if isinstance(item, Checkpoint) else item.to_dict())
+
+
+def make_product(sku: str, color: str, leftovers: List[Dict], sex: str = "М") -> Dict:
+    return {
+        "title": f"Товар {sku}",
+        "sku": sku,
+        "color": color,
+        "brand": "Бренд",
+        "sex": sex,
+        "material": "хлопок",
+        "size_table_type": "Одежда",
+        "root_category": "Одежда",
+        "price": 1000,
+        "discount_price": 900,
+        "in_the_sale": False,
+        "leftovers": leftovers,
+    }
+
+
+def random_export(seed: int, size: int = 300) -> List[Dict]:
+    rnd = random.Random(seed)
+    products = []
+    for _ in range(size):
+        sku = f"SKU{rnd.randint(0, 40)}" + rnd.choice(["", "", "-1", "-2", "-r", "-P"])
+        color = rnd.choice(["1/черный", "2/белый"])
+        leftovers = [
+            {
+                "size": rnd.choice(["S", "M", "L", "XL"]),
+                "count": rnd.randint(0, 3),
+                "price": rnd.randint(100, 200),
+            }
+            for _ in range(rnd.randint(0, 3))
+        ]
+        sex = rnd.choice(["М", "Ж", "У", "У", "?"])
+        products.append(make_product(sku, color, leftovers, sex=sex))
+    return products
+
+
+@pytest.fixture
+def write_export(tmp_path) -> Callable[..., str]:
+    """Записывает товары в файл выгрузки name в tmp_path и возвращает путь к нему"""
+    def write(products: List[Dict], name: str = "export.json", newline: str = "\n") -> str:
+        json_file = tmp_path / name
+        json_file.write_text(ujson.dumps(products, ensure_ascii=False, indent=4), newline=newline)
+        return str(json_file)
+    return write
+
+
+@pytest.fixture
+def run_parser(write_export) -> Callable[..., List]:
+    """
+    Прогоняет выгрузку через JsonParser и возвращает содержимое очереди.
+    export - товары (записываются в export.json) или путь к уже записанной выгрузке,
+    остальные аргументы передаются парсеру
+    """
+    def run(export: List[Dict] | str, queue: List | None = None, **parser_kwargs) -> List:
+        json_file = export if isinstance(export, str) else write_export(export)
+        queue = ListQueue() if queue is None else queue
+        JsonParser(json_file, queue, **parser_kwargs).run()
+        return list(queue)
+    return run
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from typing import Dict, List
+
+import pytest
+
+from src.async_writer import AsyncWriter, write_async
+from src.writers import BatchWriter
+
+
+class SlowCollection:
+    """Коллекция с задержкой ответа, считает одновременные запросы"""
+    def __init__(self, delay: float = 0.01, fail: bool = False) -> None:
+        self.delay = delay
+        self.fail = fail
+        self.docs: List[Dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def insert_many(self, docs: List[Dict], ordered: bool) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            if self.fail:
+                raise ConnectionError("connection lost")
+            self.docs.extend(docs)
+
+
+def make_writer(collection: SlowCollection, concurrency: int) -> AsyncWriter:
+    return AsyncWriter(
+        writers=[
+            BatchWriter(collection, batch_size=10, ordered=concurrency == 1)
+            for _ in range(concurrency)
+        ],
+        batch_size=10,
+    )
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_async_writer(concurrency: int) -> None:
+    collection = SlowCollection()
+    products = [{"sku": str(idx)} for idx in range(205)]
+
+    async def run() -> int:
+        writer = make_writer(collection, concurrency)
+        got_products = await write_async(iter(products), writer, queue_maxsize=50)
+        assert writer.written == 205
+        return got_products
+
+    assert asyncio.run(run()) == 205
+    assert collection.max_in_flight == concurrency
+    if concurrency == 1:
+        # Один писатель - пачки пишутся по очереди
+        assert collection.docs == products
+    else:
+        assert sorted(collection.docs, key=lambda doc: int(doc["sku"])) == products
+
+
+def test_async_writer_metrics() -> None:
+    async def run() -> AsyncWriter:
+        writer = make_writer(SlowCollection(delay=0), concurrency=3)
+        await write_async(iter([{"sku": str(idx)} for idx in range(95)]), writer, 50)
+        return writer
+
+    stats = asyncio.run(run()).metrics.stage("mongo_write")
+    assert stats.calls == 10 and stats.items == 95
+
+
+def test_async_writer_error() -> None:
+    async def run() -> None:
+        writer = make_writer(SlowCollection(fail=True), concurrency=2)
+        await write_async(iter([{"sku": str(idx)} for idx in range(100)]), writer, 50)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
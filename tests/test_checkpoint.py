@@ -0,0 +1,72 @@
+from typing import Dict, List
+
+import pytest
+
+from src.checkpoint import CheckpointJournal
+from src.json_parser import Checkpoint, JsonParser, ResumeState
+from tests.conftest import RecordQueue, random_export
+
+
+# Настройки парсера, при которых в очередь попадают контрольные точки
+CHECKPOINTED = {"sequential": True, "streaming": True, "checkpoint_interval": 20}
+
+
+def sorted_export() -> List[Dict]:
+    parser = JsonParser(..., ...)
+    products = random_export(seed=1)
+    products.sort(key=lambda p: parser.filter_id(p["sku"]))
+    return products
+
+
+def test_journal(tmp_path, write_export) -> None:
+    json_file = write_export([])
+    path = str(tmp_path / "checkpoint.jsonl")
+    journal = CheckpointJournal(path, json_file)
+    assert journal.load() is None
+
+    journal.add("A1/черный")
+    journal.save(offset=100, batches=1)
+    journal.add("B1/черный")
+    journal.save(offset=200, batches=3)
+    # Запись, оборванная при падении процесса
+    with open(path, "a") as file:
+        file.write('{"export": "')
+
+    state = CheckpointJournal(path, json_file).load()
+    assert (state.offset, state.batches) == (200, 3)
+    assert state.emitted == {"A1/черный", "B1/черный"}
+
+    journal.remove()
+    assert CheckpointJournal(path, json_file).load() is None
+
+
+def test_journal_of_another_export(tmp_path, write_export) -> None:
+    json_file = write_export([])
+    path = str(tmp_path / "checkpoint.jsonl")
+    journal = CheckpointJournal(path, json_file)
+    journal.add("A1/черный")
+    journal.save(offset=100, batches=1)
+
+    # Выгрузка изменилась после падения
+    write_export(sorted_export())
+    assert CheckpointJournal(path, json_file).load() is None
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_resume_from_checkpoint(write_export, run_parser, newline: str) -> None:
+    json_file = write_export(sorted_export(), newline=newline)
+    full_run = run_parser(json_file, RecordQueue(), **CHECKPOINTED)
+    checkpoints = [
+        idx for idx, item in enumerate(full_run) if isinstance(item, Checkpoint)
+    ]
+    assert len(checkpoints) > 1
+
+    products = [item for item in full_run if not isinstance(item, Checkpoint)]
+    for idx in checkpoints:
+        emitted = {
+            item["unique_id"] for item in full_run[:idx] if not isinstance(item, Checkpoint)
+        }
+        resume = ResumeState(offset=full_run[idx].offset, emitted=emitted)
+        resumed = run_parser(json_file, RecordQueue(), resume=resume, **CHECKPOINTED)
+        resumed = [item for item in resumed if not isinstance(item, Checkpoint)]
+        assert resumed == products[len(emitted):]
@@ -0,0 +1,192 @@
+import copy
+from typing import Dict, List
+
+import pytest
+
+import src.json_parser as json_parser
+from src.json_parser import JsonParser
+from src.consolidation import LATE_DISTANCE_WINDOWS, Consolidator, LeftoversTable
+from src.enums import JSONFieldNames as Field
+from src.field_plan import FieldPlan
+from src.models import UNIQUE_ID_FIELD
+from tests.conftest import ListQueue, make_product, random_export
+
+
+def legacy_run(parser: JsonParser, products: List[Dict]) -> List[Dict]:
+    """Прежний алгоритм JsonParser.run на find_duplicates"""
+    parser.loaded_prods = products
+    seen_products = []
+    res = []
+    for product_idx, product in enumerate(products):
+        filtered_id = parser.filter_id(product[Field.id.value])
+        unique_id = parser._get_unique_id(filtered_id, product[Field.color.value])
+        if unique_id in seen_products:
+            continue
+        parsed_prod = parser.parse_product(product)
+        if parsed_prod is None:
+            continue
+        consolidated_prod = parser.consolidate_product(
+            parsed_prod.to_dict(),
+            raw_color=product[Field.color.value],
+            start_idx=product_idx,
+        )
+        consolidated_prod[UNIQUE_ID_FIELD] = unique_id
+        res.append(consolidated_prod)
+        seen_products.append(unique_id)
+    return res
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+@pytest.mark.parametrize("sequential", [True, False])
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_legacy_algorithm(
+    run_parser, 
+    monkeypatch, 
+    sequential: bool, 
+    streaming: bool, 
+    seed: int,
+) -> None:
+    """Результат совпадает с прежним алгоритмом в обоих режимах"""
+    monkeypatch.setattr(json_parser, "SEQUENTIAL", sequential)
+    parser = JsonParser(..., ...)
+    products = random_export(seed)
+    if sequential:
+        # Частично отсортированная выгрузка: серии одинаковых id
+        products.sort(key=lambda p: parser.filter_id(p["sku"]))
+
+    expected = legacy_run(parser, copy.deepcopy(products))
+    assert run_parser(products, sequential=sequential, streaming=streaming) == expected
+
+
+def test_global_mode_does_not_depend_on_order(run_parser) -> None:
+    products = [
+        make_product("A-1", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+        make_product("B", "1/черный", [{"size": "M", "count": 2, "price": 20}]),
+        make_product("A-2", "1/черный", [{"size": "S", "count": 3, "price": 30}]),
+        make_product("A", "2/белый", [{"size": "L", "count": 1, "price": 40}]),
+    ]
+    res = run_parser(products, sequential=False)
+
+    assert [(p["sku"], p["color"]) for p in res] == [
+        ("A", "черный"), ("B", "черный"), ("A", "белый"),
+    ]
+    assert res[0][Field.leftovers.value] == [{"size": "S", "count": 4, "price": 30}]
+
+
+def test_invalid_head_is_skipped(run_parser) -> None:
+    """Остатки не валидных записей до головной не суммируются"""
+    products = [
+        make_product("A-1", "1/черный", [{"size": "S", "count": 5, "price": 10}], sex="?"),
+        make_product("A-2", "1/черный", [{"size": "S", "count": 1, "price": 20}]),
+        make_product("A-3", "1/черный", [{"size": "S", "count": 2, "price": 30}], sex="?"),
+    ]
+    res = run_parser(products, sequential=False)
+
+    assert len(res) == 1
+    assert res[0][Field.leftovers.value] == [{"size": "S", "count": 3, "price": 30}]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_vectorized_matches_leftovers_sum(run_parser, seed: int) -> None:
+    products = random_export(seed, size=1000)
+    expected = run_parser(products, sequential=False, vectorized=False)
+    assert run_parser(products, sequential=False, vectorized=True) == expected
+
+
+def test_leftovers_table() -> None:
+    table = LeftoversTable(FieldPlan.compile(json_parser.DUPLICATE_ENDING))
+    table.add(2, [{"size": "M", "count": 1, "price": 10}, {"size": "S", "count": 2, "price": 20}])
+    table.add(0, [{"size": "S", "count": 5, "price": 30}])
+    table.add(2, [{"size": "S", "count": 3, "price": 40}, {"size": "L", "count": 0, "price": 50}])
+    table.add(1, [])
+
+    res = [leftovers.to_list() for leftovers in table.aggregate(groups=3)]
+    assert res == [
+        [{"size": "S", "count": 5, "price": 30}],
+        [],
+        [
+            {"size": "M", "count": 1, "price": 50},
+            {"size": "S", "count": 5, "price": 50},
+            {"size": "L", "count": 0, "price": 50},
+        ],
+    ]
+    # Таблица очищается после подсчета
+    assert [leftovers.to_list() for leftovers in table.aggregate(groups=1)] == [[]]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_wide_window_matches_global_mode(tmp_path, run_parser, seed: int) -> None:
+    products = random_export(seed)
+    expected = run_parser(products, sequential=False)
+
+    queue = ListQueue()
+    JsonParser(str(tmp_path / "export.json"), queue, window=len(products)).run()
+    assert list(queue) == expected
+
+
+@pytest.mark.parametrize("window, late_duplicates", [(2, 1), (3, 0)])
+def test_window(tmp_path, window: int, late_duplicates: int) -> None:
+    products = [
+        make_product("A-1", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+        make_product("B", "1/черный", [{"size": "M", "count": 2, "price": 20}]),
+        make_product("C", "1/черный", [{"size": "M", "count": 2, "price": 20}]),
+        make_product("A-2", "1/черный", [{"size": "S", "count": 3, "price": 30}]),
+    ]
+    parser = JsonParser(..., ...)
+    consolidator = Consolidator(parser, sequential=False, window=window)
+    res = [prod.to_dict() for prod in consolidator.consolidate(copy.deepcopy(products))]
+
+    assert [p["sku"] for p in res] == ["A", "B", "C"]
+    count = 1 if late_duplicates else 4
+    assert res[0][Field.leftovers.value] == [
+        {"size": "S", "count": count, "price": 10 if late_duplicates else 30}
+    ]
+    assert consolidator.late_duplicates == late_duplicates
+    assert consolidator.max_late_distance == (3 if late_duplicates else 0)
+
+
+def test_window_state_is_bounded() -> None:
+    window = 2
+    products = [make_product(f"SKU{idx}", "1/черный", []) for idx in range(100)]
+    products.append(make_product("SKU0-1", "1/черный", []))
+    products.append(make_product("SKU98-1", "1/черный", []))
+    parser = JsonParser(..., ...)
+    consolidator = Consolidator(parser, sequential=False, window=window)
+    for product in products:
+        list(consolidator.add(product))
+        assert len(consolidator._closed_at) <= window * LATE_DISTANCE_WINDOWS + 1
+
+    # Расстояние дальнего дубликата не хранится, ближний учитывается в max_late_distance
+    assert consolidator.late_duplicates == 2
+    assert consolidator.far_late_duplicates == 1
+    assert consolidator.max_late_distance == 3
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_projected_decoding(tmp_path, run_parser, workers: int) -> None:
+    products = random_export(seed=0)
+    for product in products:
+        product["fashion_season"] = "2023-1"
+    expected = run_parser(products, sequential=False)
+
+    queue = ListQueue()
+    JsonParser(
+        str(tmp_path / "export.json"), 
+        queue, 
+        sequential=False, 
+        workers=workers, 
+        projected=True,
+    ).run()
+    assert list(queue) == expected
+
+
+def test_leftovers_table_non_integer_counts(run_parser) -> None:
+    products = random_export(seed=0) + [
+        make_product("NEW", "1/черный", [{"size": "S", "count": 1.5, "price": 10}]),
+        make_product("NEW-1", "1/черный", [{"size": "S", "count": 2, "price": 10}]),
+    ]
+    expected = run_parser(products, sequential=False, vectorized=False)
+
+    # Дробные количества не отбрасываются: остатки суммируются по строкам
+    assert run_parser(products, sequential=False, vectorized=True) == expected
+    assert expected[-1]["leftovers"] == [{"size": "S", "count": 3.5, "price": 10}]
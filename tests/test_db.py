@@ -0,0 +1,36 @@
+import pytest
+
+from src.db import get_client, get_db
+from src.settings import Settings
+
+
+def make_settings(**options) -> Settings:
+    settings = Settings()
+    settings._db_name = "products"
+    settings._server_selection_timeout_ms = 100
+    for name, value in options.items():
+        setattr(settings, f"_{name}", value)
+    return settings
+
+
+def test_client_options() -> None:
+    settings = make_settings(max_pool_size=50, write_concern="fast", compressors="zlib")
+    client = get_client(settings)
+    try:
+        assert client.options.pool_options.max_pool_size == 50
+        assert client.write_concern.document == {"w": 1, "j": False}
+        assert client.options.pool_options._compression_settings.compressors == ["zlib"]
+        # Клиент с пулом соединений переиспользуется
+        assert get_client(make_settings(max_pool_size=50, write_concern="fast", compressors="zlib")) is client
+        assert get_db(settings).client is client
+        safe_client = get_client(make_settings(write_concern="safe"))
+        assert safe_client is not client
+        assert safe_client.write_concern.document == {"w": "majority", "j": True}
+        safe_client.close()
+    finally:
+        client.close()
+
+
+def test_unknown_write_concern() -> None:
+    with pytest.raises(ValueError):
+        make_settings(write_concern="unsafe").client_options
@@ -0,0 +1,43 @@
+from src.delta import DeltaTracker, snapshot_from_export, leftovers_diff
+from src.enums import DeltaStatus
+from tests.conftest import ListQueue, make_product
+from src.json_parser import JsonParser
+
+
+def test_leftovers_diff() -> None:
+    assert leftovers_diff({"S": 1, "M": 2}, {"M": 2, "L": 3}) == {"L": 3, "S": -1}
+    assert leftovers_diff({"S": 1}, {"S": 1}) == {}
+
+
+def test_delta_between_exports(write_export) -> None:
+    previous = [
+        make_product("A-1", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+        make_product("A-2", "1/черный", [{"size": "M", "count": 2, "price": 10}]),
+        make_product("B", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+        make_product("C", "1/черный", [{"size": "L", "count": 4, "price": 10}]),
+    ]
+    current = [
+        make_product("A-1", "1/черный", [{"size": "S", "count": 3, "price": 10}]),
+        make_product("A-2", "1/черный", [{"size": "M", "count": 2, "price": 10}]),
+        make_product("B", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+        make_product("D", "1/черный", [{"size": "S", "count": 1, "price": 10}]),
+    ]
+    snapshot = snapshot_from_export(write_export(previous, name="previous.json"))
+
+    queue = ListQueue()
+    JsonParser(write_export(current, name="current.json"), queue).run()
+    tracker = DeltaTracker(previous=snapshot)
+    deltas = [delta for delta in map(tracker.add, queue) if delta is not None]
+    deltas.extend(tracker.removed())
+
+    assert [(d.unique_id, d.status.name, d.leftovers_diff) for d in deltas] == [
+        ("A1/черный", DeltaStatus.changed.name, {"S": 2}),
+        ("D1/черный", DeltaStatus.added.name, {"S": 1}),
+        ("C1/черный", DeltaStatus.removed.name, {"L": -4}),
+    ]
+    assert deltas[0].product["sku"] == "A"
+
+    # Повторное сравнение с тем же снимком не находит изменений
+    tracker = DeltaTracker(previous=tracker.snapshot)
+    assert all(tracker.add(product) is None for product in queue)
+    assert list(tracker.removed()) == []
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+import ujson
+
+import src.json_parser as json_parser
+from src.external_sort import external_sort
+from src.json_parser import JsonParser
+from src.metrics import Metrics
+from tests.conftest import ListQueue, make_product, random_export
+
+
+@pytest.mark.parametrize("run_size", [1, 7, 100, 1000])
+def test_external_sort(tmp_path, run_size: int) -> None:
+    rnd = random.Random(0)
+    records = [
+        ((rnd.choice("ABC"), rnd.choice("xy"), seq), {"seq": seq, "title": "товар"})
+        for seq in range(300)
+    ]
+    metrics = Metrics()
+    res = list(external_sort(iter(records), metrics, run_size=run_size, tmp_dir=str(tmp_path)))
+
+    assert res == [product for _, product in sorted(records, key=lambda record: record[0])]
+    assert metrics.stage("sort_run").items == 300
+    # Временные файлы серий удаляются
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_global_mode(tmp_path, run_parser, monkeypatch, seed: int) -> None:
+    monkeypatch.setattr(json_parser, "SORT_RUN_SIZE", 64)
+    products = random_export(seed)
+    expected = run_parser(products, sequential=False)
+
+    queue = ListQueue()
+    JsonParser(str(tmp_path / "export.json"), queue, external_sort=True).run()
+    assert sorted(queue, key=lambda p: p["unique_id"]) == sorted(
+        expected, key=lambda p: p["unique_id"]
+    )
+
+
+def test_multiple_files(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(json_parser, "SORT_RUN_SIZE", 2)
+    for idx, products in enumerate([
+        [
+            make_product("A-1", "1/черный", [{"size": "S", "count": 5, "price": 10}], sex="?"),
+            make_product("B", "1/черный", [{"size": "M", "count": 1, "price": 20}]),
+        ],
+        [
+            make_product("A-2", "1/черный", [{"size": "S", "count": 1, "price": 30}]),
+            make_product("B-r", "1/черный", [{"size": "M", "count": 2, "price": 40}]),
+            make_product("A", "1/черный", [{"size": "S", "count": 2, "price": 50}]),
+        ],
+    ]):
+        (tmp_path / f"export-{idx}.json").write_text(ujson.dumps(products, ensure_ascii=False))
+
+    queue = ListQueue()
+    JsonParser(str(tmp_path), queue, external_sort=True).run()
+    assert [(p["sku"], p["leftovers"]) for p in queue] == [
+        # Остатки записи до головной (пол не распознан) не суммируются
+        ("A", [{"size": "S", "count": 3, "price": 50}]),
+        ("B", [{"size": "M", "count": 3, "price": 40}]),
+    ]
@@ -0,0 +1,70 @@
+from enum import Enum
+
+from src.consolidation import Consolidator
+from src.field_plan import FieldPlan
+from src.json_parser import DUPLICATE_ENDING, JsonParser
+from tests.conftest import make_product
+
+
+class RenamedFields(Enum):
+    """Маппинг выгрузки, в которой поля id и остатков названы иначе"""
+    title = "title"
+    id = "article"
+    root_category = "root_category"
+    sex = "sex"
+    color = "color"
+    color_code = "color_code"
+    brand = "brand"
+    price = "price"
+    discount_price = "discount_price"
+    size_table_type = "size_table_type"
+    in_the_sale = "in_the_sale"
+    leftovers = "stock"
+    quantity = "qty"
+    size = "size"
+
+
+def test_compile() -> None:
+    plan = FieldPlan.compile(DUPLICATE_ENDING)
+    product = make_product("ABC-1", "1/черный", [{"size": "S", "count": 2, "price": 10}])
+
+    assert plan.id == "sku" and plan.quantity == "count"
+    assert plan.id_and_color(product) == ("ABC-1", "1/черный")
+    assert plan.prices(product) == (1000, 900)
+    assert plan.leftover_row(product["leftovers"][0]) == ("S", 2, 10)
+    assert plan.filter_id("ABC-DEF-r") == "ABC-DEF"
+    assert plan.filter_id("ABC-DEF") == "ABC-DEF"
+
+
+def test_remapped_fields() -> None:
+    plan = FieldPlan.compile(DUPLICATE_ENDING, fields=RenamedFields)
+    products = []
+    for sku, count in [("A", 1), ("A-1", 2), ("B", 3)]:
+        product = make_product(sku, "1/черный", [])
+        product["article"] = product.pop("sku")
+        product["stock"] = [{"size": "S", "qty": count, "price": 10}]
+        products.append(product)
+
+    parser = JsonParser(..., ...)
+    parser.fields = plan
+    res = list(Consolidator(parser, sequential=False).consolidate(products))
+    assert [(product.sku, product.leftovers.to_list()) for product in res] == [
+        ("A", [{"size": "S", "count": 3, "price": 10}]),
+        ("B", [{"size": "S", "count": 3, "price": 10}]),
+    ]
+
+
+def test_filter_id_once_per_record() -> None:
+    parser = JsonParser(..., ...)
+    calls = []
+    filter_id = parser.filter_id
+    parser.filter_id = lambda id: calls.append(id) or filter_id(id)
+    products = [
+        make_product(sku, "1/черный", [{"size": "S", "count": 1, "price": 10}])
+        for sku in ("A", "A-1", "B")
+    ]
+    res = list(Consolidator(parser, sequential=False).consolidate(products))
+
+    assert [product.sku for product in res] == ["A", "B"]
+    # Головная запись группы не фильтрует id повторно в parse_product
+    assert calls == ["A", "A-1", "B"]
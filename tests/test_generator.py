@@ -0,0 +1,45 @@
+import ujson
+
+from benchmarks.generate import ExportConfig, generate_export, generate_records
+from src.json_parser import JsonParser
+from tests.conftest import ListQueue
+from tests.test_consolidation import legacy_run
+
+
+def test_generated_export_parses(tmp_path) -> None:
+    json_file = str(tmp_path / "export.json")
+    generate_export(json_file, ExportConfig(products=500))
+    with open(json_file) as file:
+        products = ujson.load(file)
+    assert len(products) == 500
+
+    queue = ListQueue()
+    parser = JsonParser(json_file=json_file, queue=queue, sequential=False)
+    parser.run()
+    assert queue == legacy_run(parser, products)
+    # Дубликаты схлопываются
+    assert 0 < len(queue) < len(products)
+
+
+def test_records_are_deterministic() -> None:
+    config = ExportConfig(products=1000, sortedness=0.5)
+    assert generate_records(config) == generate_records(config)
+
+
+def test_sortedness() -> None:
+    sorted_records = generate_records(ExportConfig(products=1000, sortedness=1.0))
+    product_ids = [product_idx for _, product_idx, _ in sorted_records]
+    assert product_ids == sorted(product_ids)
+
+    shuffled_records = generate_records(ExportConfig(products=1000, sortedness=0.0))
+    assert sorted(shuffled_records) == sorted(sorted_records)
+    assert shuffled_records != sorted_records
+
+
+def test_duplicate_rate() -> None:
+    unique = generate_records(ExportConfig(products=1000, duplicate_rate=0.0))
+    assert all(copy_idx == 0 for _, _, copy_idx in unique)
+
+    records = generate_records(ExportConfig(products=1000, duplicate_rate=0.5))
+    duplicates = sum(1 for _, _, copy_idx in records if copy_idx)
+    assert 300 < duplicates < 700
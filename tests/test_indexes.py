@@ -0,0 +1,59 @@
+from typing import Dict, List
+
+import pytest
+from pymongo import IndexModel
+
+from src.models import UNIQUE_ID_FIELD
+from src.indexes import PRODUCT_INDEXES, ensure_indexes, product_indexes
+from src.metrics import Metrics
+
+
+class IndexCollection:
+    """Коллекция, запоминающая созданные индексы"""
+    name = "products"
+
+    def __init__(self) -> None:
+        self.indexes = {}
+
+    def index_information(self) -> Dict[str, Dict]:
+        return dict(self.indexes)
+
+    def create_indexes(self, indexes: List[IndexModel]) -> List[str]:
+        for index in indexes:
+            assert index.document["name"] not in self.indexes
+            self.indexes[index.document["name"]] = index.document
+        return [index.document["name"] for index in indexes]
+
+
+def test_ensure_indexes() -> None:
+    collection = IndexCollection()
+    metrics = Metrics()
+    ensure_indexes(collection, metrics)
+    ensure_indexes(collection, metrics)
+
+    assert set(collection.indexes) == {
+        "sku_1_color_1",
+        "brand.slug_1",
+        "root_category.slug_1",
+        "color_1",
+    }
+    stats = metrics.stage("index_build")
+    assert stats.calls == 2 and stats.items == 2 * len(PRODUCT_INDEXES)
+
+
+@pytest.mark.parametrize("existing", [False, True])
+def test_unique_id_index(existing: bool) -> None:
+    collection = IndexCollection()
+    if existing:
+        # Уникальный индекс без фильтра, созданный прежней версией импорта
+        collection.indexes[f"{UNIQUE_ID_FIELD}_1"] = {"unique": True}
+    ensure_indexes(collection, Metrics(), product_indexes(upsert=True))
+
+    index = collection.indexes[f"{UNIQUE_ID_FIELD}_1"]
+    assert index["unique"]
+    if not existing:
+        # Документы без unique_id не попадают в уникальный индекс
+        assert index["partialFilterExpression"] == {UNIQUE_ID_FIELD: {"$exists": True}}
+    assert f"{UNIQUE_ID_FIELD}_1" not in {
+        index.document["name"] for index in product_indexes(upsert=False)
+    }
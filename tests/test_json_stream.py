@@ -0,0 +1,130 @@
+import io
+
+import pytest
+import ujson
+
+from src.json_stream import (
+    decode_span, 
+    iter_json_array, 
+    iter_json_array_offsets, 
+    load_mapped, 
+    load_projected, 
+    map_export,
+)
+
+
+PRODUCTS = [
+    {"sku": "A-1", "title": "скобки ] [ } {", "leftovers": [{"size": "S", "count": 1}]},
+    {"sku": "B", "title": "кавычки \" и \\\\ слеши", "leftovers": []},
+    {"sku": "C", "price": 12345678, "in_the_sale": True, "color": None},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [0, 4])
+def test_iter_json_array(chunk_size: int, indent: int) -> None:
+    file = io.StringIO(ujson.dumps(PRODUCTS, ensure_ascii=False, indent=indent))
+    assert list(iter_json_array(file, chunk_size=chunk_size)) == PRODUCTS
+
+
+def test_empty_array() -> None:
+    assert list(iter_json_array(io.StringIO("  [ \n ]  "), chunk_size=2)) == []
+
+
+def test_not_an_array() -> None:
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('{"sku": "A"}')))
+
+
+def test_truncated_array() -> None:
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"sku": "A"}, {"sku": "B"'), chunk_size=4))
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 80))
+def test_tokens_split_between_chunks(chunk_size: int) -> None:
+    text = '[{"title": "' + "x" * 40 + '", "a": -1.5e+3, "b": "\\u00e9\\n", "c": [true, false, null]}, 10]'
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == ujson.loads(text)
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text: str) -> None:
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size: int = -1) -> str:
+        self.reads += 1
+        return super().read(size)
+
+
+def test_malformed_item_is_not_buffered() -> None:
+    """Испорченная запись не заставляет дочитывать в буфер весь остаток файла"""
+    valid = ujson.dumps(PRODUCTS[0], ensure_ascii=False)
+    file = CountingReader("[" + '{"sku": "A", title: 1}, ' + ", ".join([valid] * 1000) + "]")
+    with pytest.raises(ValueError):
+        list(iter_json_array(file, chunk_size=64))
+
+    assert file.reads == 1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_resume_from_offset(tmp_path, chunk_size: int, newline: str) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_text(
+        ujson.dumps(PRODUCTS, ensure_ascii=False, indent=4), 
+        encoding="utf-8", 
+        newline=newline,
+    )
+
+    with open(json_file, encoding="utf-8", newline="") as file:
+        items = list(iter_json_array_offsets(file, chunk_size=chunk_size))
+    assert [item for item, _ in items] == PRODUCTS
+
+    for idx, (_, offset) in enumerate(items):
+        with open(json_file, encoding="utf-8", newline="") as file:
+            rest = list(iter_json_array_offsets(file, offset=offset, chunk_size=chunk_size))
+        assert rest == items[idx + 1:]
+
+
+@pytest.mark.parametrize("indent", [0, 4])
+def test_mapped_export(tmp_path, indent: int) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_text(ujson.dumps(PRODUCTS, ensure_ascii=False, indent=indent), encoding="utf-8")
+    assert load_mapped(str(json_file)) == PRODUCTS
+
+    data = json_file.read_bytes()
+    # Ключ sku есть только у объектов верхнего уровня и идет в них первым
+    keys = [idx for idx in range(len(data)) if data.startswith(b'"sku"', idx)]
+    starts = [data.rindex(b"{", 0, key) for key in keys]
+    spans = list(zip(starts, starts[1:] + [data.rindex(b"]")]))
+    with map_export(str(json_file)) as mapped:
+        assert decode_span(mapped, *spans[0]) == PRODUCTS[:1]
+        assert decode_span(mapped, spans[1][0], spans[2][1]) == PRODUCTS[1:]
+        assert decode_span(mapped, spans[2][1], spans[2][1]) == []
+
+
+def test_mapped_empty_file(tmp_path) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_bytes(b"")
+    with pytest.raises(ValueError):
+        load_mapped(str(json_file))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 50, 1 << 20])
+def test_load_projected(tmp_path, chunk_size: int) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_text(ujson.dumps(PRODUCTS, ensure_ascii=False, indent=4), encoding="utf-8")
+
+    fields = {"sku", "leftovers", "color"}
+    expected = [
+        {name: value for name, value in product.items() if name in fields}
+        for product in PRODUCTS
+    ]
+    assert load_projected(str(json_file), fields, key="sku", chunk_size=chunk_size) == expected
+
+
+def test_load_projected_empty_array(tmp_path) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_text("[]")
+    assert load_projected(str(json_file), {"sku"}, key="sku") == []
@@ -0,0 +1,103 @@
+import os
+from multiprocessing import Process, Queue
+from typing import Dict, List
+
+import pytest
+
+import src.main as main
+from src.delta import load_snapshot, save_snapshot, snapshot_from_export
+from src.json_parser import JsonParser
+from src.main import ParserFailed, iter_queue, produce, write_delta
+from src.metrics import Metrics
+from tests.conftest import make_product
+
+
+PRODUCTS = [
+    make_product(f"SKU{idx}", "1/черный", [{"size": "S", "count": 1, "price": 10}])
+    for idx in range(3)
+]
+
+
+def truncate(json_file: str) -> str:
+    """Обрывает выгрузку на середине, как при недописанном файле"""
+    with open(json_file) as file:
+        text = file.read()
+    with open(json_file, "w") as file:
+        file.write(text[:len(text) // 2])
+    return json_file
+
+
+def test_iter_queue(write_export) -> None:
+    queue = Queue()
+    produce(JsonParser(write_export(PRODUCTS), queue), queue)
+
+    assert [prod["sku"] for prod in iter_queue(queue, Metrics())] == ["SKU0", "SKU1", "SKU2"]
+
+
+def test_parser_failure(write_export) -> None:
+    queue = Queue()
+    with pytest.raises(ValueError):
+        produce(JsonParser(truncate(write_export(PRODUCTS)), queue), queue)
+
+    # Поток не заканчивается как полный: запись получает ошибку парсера
+    with pytest.raises(ParserFailed, match="JSONDecodeError"):
+        list(iter_queue(queue, Metrics()))
+
+
+def test_killed_parser(monkeypatch) -> None:
+    monkeypatch.setattr(main, "QUEUE_POLL_TIMEOUT", 0.1)
+    queue = Queue()
+    # Процесс завершается, не отправив маркер конца потока, как при SIGKILL
+    producer = Process(target=os._exit, args=(9,))
+    producer.start()
+
+    with pytest.raises(ParserFailed, match="exited with code 9"):
+        list(iter_queue(queue, Metrics(), producer=producer))
+
+
+class RecordingWriter:
+    def __init__(self) -> None:
+        self.written: List[Dict] = []
+        self.removed: List[str] | None = None
+
+    def write(self, product: Dict) -> None:
+        self.written.append(product)
+
+    def remove(self, unique_ids: List[str]) -> None:
+        self.removed = unique_ids
+
+
+def test_delta_after_parser_failure(tmp_path, write_export, monkeypatch) -> None:
+    monkeypatch.setattr(main, "SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    monkeypatch.setattr(main, "DELTA_PATH", str(tmp_path / "delta.jsonl"))
+    save_snapshot(main.SNAPSHOT_PATH, snapshot_from_export(write_export(PRODUCTS)))
+
+    queue = Queue()
+    with pytest.raises(ValueError):
+        produce(JsonParser(truncate(write_export(PRODUCTS)), queue), queue)
+    writer = RecordingWriter()
+    with pytest.raises(ParserFailed):
+        write_delta(iter_queue(queue, Metrics()), writer)
+
+    # Товары, до которых парсер не дошел, не считаются удаленными
+    assert writer.removed is None
+    assert len(load_snapshot(main.SNAPSHOT_PATH)) == 3
+
+
+def test_delta_without_export_files(tmp_path, write_export, monkeypatch) -> None:
+    monkeypatch.setattr(main, "SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    monkeypatch.setattr(main, "DELTA_PATH", str(tmp_path / "delta.jsonl"))
+    save_snapshot(main.SNAPSHOT_PATH, snapshot_from_export(write_export(PRODUCTS)))
+    exports = tmp_path / "exports"
+    exports.mkdir()
+
+    queue = Queue()
+    with pytest.raises(FileNotFoundError):
+        produce(JsonParser(str(exports), queue), queue)
+    writer = RecordingWriter()
+    with pytest.raises(ParserFailed, match="No export files found"):
+        write_delta(iter_queue(queue, Metrics()), writer)
+
+    # Пустой каталог выгрузок - ошибка, а не пустая выгрузка: каталог не удаляется
+    assert writer.removed is None
+    assert len(load_snapshot(main.SNAPSHOT_PATH)) == 3
@@ -0,0 +1,73 @@
+import pytest
+
+import src.metrics as metrics_module
+from src.metrics import Metrics, StageStats
+
+
+def test_stage_stats() -> None:
+    stats = StageStats()
+    for ms in range(1, 101):
+        stats.add(ms / 1000, items=2)
+
+    report = stats.report()
+    assert report["calls"] == 100 and report["items"] == 200
+    assert report["p50"] == pytest.approx(0.05, abs=0.001)
+    assert report["p99"] == pytest.approx(0.099, abs=0.001)
+    assert report["items_per_second"] == pytest.approx(200 / stats.seconds)
+
+
+def test_reservoir_is_bounded(monkeypatch) -> None:
+    monkeypatch.setattr(metrics_module, "RESERVOIR_SIZE", 10)
+    stats = StageStats()
+    for _ in range(100):
+        stats.add(1.0)
+    other = StageStats()
+    for _ in range(300):
+        other.add(2.0)
+    stats.merge(other)
+
+    assert stats.calls == 400 and len(stats.samples) <= 10
+    assert stats.percentile(0.5) == 2.0
+
+
+def test_prometheus_format() -> None:
+    metrics = Metrics()
+    metrics.stage("parse_product").add(0.5)
+    metrics.stage("mongo_write").add(1.0, items=1000)
+    lines = metrics.to_prometheus().splitlines()
+
+    assert 'products_parser_stage_items_total{stage="mongo_write"} 1000' in lines
+    assert 'products_parser_stage_latency_seconds{stage="parse_product",quantile="0.5"} 0.5' in lines
+    # Все строки одного семейства метрик идут подряд после его TYPE
+    names = [
+        line.split("{")[0].removesuffix("_sum").removesuffix("_count") 
+        for line in lines if not line.startswith("#")
+    ]
+    for name in set(names):
+        idx = [i for i, n in enumerate(names) if n == name]
+        assert idx == list(range(idx[0], idx[-1] + 1))
+
+
+class Timed:
+    def __init__(self) -> None:
+        self.metrics = Metrics()
+
+    def method(self) -> int:
+        return 1
+
+
+def test_timed(monkeypatch) -> None:
+    monkeypatch.setattr(metrics_module, "TIMING_SAMPLE_RATE", 4)
+    per_call = metrics_module.timed("per_call")(Timed.method)
+    batch = metrics_module.timed("batch", per_call=False)(Timed.method)
+
+    obj = Timed()
+    for _ in range(10):
+        assert per_call(obj) == batch(obj) == 1
+    # Каждый вызов учитывается, а у методов внутренних циклов замеряется один из четырех
+    per_call_stats = obj.metrics.stage("per_call")
+    batch_stats = obj.metrics.stage("batch")
+    assert per_call_stats.calls == per_call_stats.items == batch_stats.calls == 10
+    assert per_call_stats.timed == len(per_call_stats.samples) == 3
+    assert batch_stats.timed == len(batch_stats.samples) == 10
+    assert per_call_stats.seconds == pytest.approx(sum(per_call_stats.samples) * 4)
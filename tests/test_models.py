@@ -0,0 +1,74 @@
+import pickle
+
+from src.json_parser import JsonParser
+from src.consolidation import LeftoversSum
+from src.models import Product
+from tests.conftest import make_product
+
+
+def parse(product) -> Product:
+    return JsonParser(..., ...).parse_product(product)
+
+
+def test_to_dict() -> None:
+    prod = parse(make_product("A-1", "12/черный", []))
+    prod.leftovers = LeftoversSum({"S": 1, "M": 0}, price=10).build()
+    prod.unique_id = "A12/черный"
+
+    assert prod.to_dict() == {
+        "title": "Товар A-1",
+        "sku": "A",
+        "color": "черный",
+        "color_code": "12",
+        "brand": {"name": "Бренд", "slug": "brend-12-chernyi-a"},
+        "sex": "male",
+        "root_category": {"name": "Одежда", "slug": "odezhda"},
+        "price": 900,
+        "discount_price": 900,
+        "in_the_sale": False,
+        "size_table_type": "Одежда",
+        "leftovers": [
+            {"size": "S", "count": 1, "price": 10},
+            {"size": "M", "count": 0, "price": 10},
+        ],
+        "unique_id": "A12/черный",
+    }
+
+
+def test_pickle() -> None:
+    prod = parse(make_product("A", "12/черный", []))
+    assert pickle.loads(pickle.dumps(prod)) == prod
+
+    prod.leftovers = LeftoversSum({"S": 1}, price=10).build()
+    prod.unique_id = "A12/черный"
+    restored = pickle.loads(pickle.dumps(prod))
+    assert restored == prod
+    assert restored.to_dict() == prod.to_dict()
+
+
+def test_shared_strings() -> None:
+    parser = JsonParser(..., ...)
+    # Одинаковые строки из разных объектов выгрузки, как их создает декодер JSON
+    first = parser.parse_product(make_product("A", "".join(["12/", "черный"]), []))
+    second = parser.parse_product(make_product("B", "".join(["12/", "черный"]), []))
+
+    assert first.color is second.color
+    assert first.brand.name is second.brand.name
+    assert first.root_category is second.root_category
+
+
+def test_non_integer_counts(run_parser) -> None:
+    products = [
+        make_product("A", "1/черный", [{"size": "S", "count": 1.5, "price": 10}]),
+        make_product("A-1", "1/черный", [{"size": "S", "count": 2, "price": 10}, {"size": "M", "count": 1, "price": 10}]),
+    ]
+    # Количества суммируются как есть, как в прежнем построчном суммировании
+    res = run_parser(products, sequential=True)
+    assert res[0]["leftovers"] == [
+        {"size": "S", "count": 3.5, "price": 10},
+        {"size": "M", "count": 1, "price": 10},
+    ]
+
+    prod = parse(make_product("A", "12/черный", []))
+    prod.leftovers = LeftoversSum({"S": 0.5}, price=10).build()
+    assert pickle.loads(pickle.dumps(prod)) == prod
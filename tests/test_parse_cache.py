@@ -0,0 +1,104 @@
+import os
+
+import src.json_parser as json_parser
+from src.json_parser import JsonParser
+from src.parse_cache import ParseCache, cache_key
+from src.quarantine import MemoryQuarantine
+from tests.conftest import ListQueue, random_export
+from tests.test_field_plan import RenamedFields
+
+
+def test_warm_run_skips_parsing(tmp_path, write_export, run_parser, monkeypatch) -> None:
+    json_file = write_export(random_export(seed=0))
+    cache_dir = str(tmp_path / "cache")
+
+    expected = run_parser(json_file, sequential=False, cache_dir=None)
+    assert run_parser(json_file, sequential=False, cache_dir=cache_dir) == expected
+    assert len(os.listdir(cache_dir)) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("export is parsed again")
+
+    monkeypatch.setattr(JsonParser, "parse_product", fail)
+    monkeypatch.setattr(json_parser, "iter_json_array", fail)
+    assert run_parser(json_file, sequential=False, cache_dir=cache_dir) == expected
+
+
+def test_cache_key(write_export) -> None:
+    json_file = write_export(random_export(seed=0))
+    config = {"sequential": True}
+    key = cache_key([json_file], config)
+
+    assert cache_key([json_file], config) == key
+    assert cache_key([json_file], {"sequential": False}) != key
+    write_export(random_export(seed=1))
+    assert cache_key([json_file], config) != key
+
+
+def test_config_changes_key(tmp_path, write_export, run_parser) -> None:
+    json_file = write_export(random_export(seed=0))
+    cache_dir = str(tmp_path / "cache")
+
+    run_parser(json_file, sequential=True, cache_dir=cache_dir)
+    run_parser(json_file, sequential=False, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_interrupted_write(tmp_path) -> None:
+    cache = ParseCache(str(tmp_path), "key")
+    products = cache.write(iter(range(5000)))
+    next(products)
+    products.close()
+
+    assert not cache.exists()
+    assert os.listdir(tmp_path) == []
+
+
+def test_warm_run_replays_quarantine(tmp_path, write_export) -> None:
+    json_file = write_export(random_export(seed=0))
+    cache_dir = str(tmp_path / "cache")
+
+    runs = []
+    for _ in range(2):
+        quarantine = MemoryQuarantine()
+        JsonParser(json_file, ListQueue(), cache_dir=cache_dir, quarantine=quarantine).run()
+        runs.append(quarantine)
+
+    cold, warm = runs
+    assert {record["run_id"] for record in warm.records} == {warm.run_id}
+    for record in cold.records + warm.records:
+        del record["run_id"]
+    assert cold.records and warm.records == cold.records
+    assert warm.counts == cold.counts
+
+
+class InsertingQuarantine(MemoryQuarantine):
+    """Как insert_many в pymongo: дописывает _id в записи и не принимает записи с _id"""
+    def __init__(self) -> None:
+        super().__init__()
+        # Каждая запись пишется сразу, до записи кэша
+        self._batch_size = 1
+
+    def _write(self, batch) -> None:
+        for record in batch:
+            assert "_id" not in record, "E11000 duplicate key error"
+            record["_id"] = len(self.records)
+            self.records.append(record)
+
+
+def test_warm_run_replays_inserted_quarantine(tmp_path, write_export) -> None:
+    json_file = write_export(random_export(seed=0))
+    cache_dir = str(tmp_path / "cache")
+
+    for _ in range(2):
+        quarantine = InsertingQuarantine()
+        JsonParser(json_file, ListQueue(), cache_dir=cache_dir, quarantine=quarantine).run()
+        assert quarantine.records
+
+
+def test_mapping_changes_key(monkeypatch) -> None:
+    parser = JsonParser(..., ...)
+    config = parser._cache_config(["export.json"])
+    monkeypatch.setattr(json_parser, "JSONFieldNames", RenamedFields)
+
+    assert parser._cache_config(["export.json"]) != config
@@ -111,7 +111,9 @@ def test_get_category_object() -> None:
 
     p = {Field.root_category.value: "Category"}
     cat = parser._get_category_object(p)
-    assert cat["name"] == "Category" and cat["slug"] == slugify("Category")
+    assert cat.name == "Category" and cat.slug == slugify("Category")
+    # Объект категории один на все товары категории
+    assert parser._get_category_object(dict(p)) is cat
 
 
 def test_get_brand_object() -> None:
@@ -122,8 +124,17 @@ def test_get_brand_object() -> None:
     color_code = "731"
     sku = "qwerty"
     br = parser._get_brand_obj(p, color=color, color_code=color_code, sku=sku)
-    assert br["name"] == "Brand"
-    assert br["slug"] == slugify(f"{br['name']}+{color_code}+{color}+{sku}")
+    assert br.name == "Brand"
+    assert br.slug == slugify(f"{br.name}+{color_code}+{color}+{sku}")
+
+
+@pytest.mark.parametrize("brand", [None, 1, 1.5])
+def test_get_non_string_brand_object(brand) -> None:
+    parser = JsonParser(..., ...)
+
+    br = parser._get_brand_obj({Field.brand.value: brand}, color="a", color_code="b", sku="1")
+    assert br.name == brand
+    assert br.slug == slugify(f"{brand}+b+a+1")
 
 
 def test_unique_id() -> None:
@@ -0,0 +1,61 @@
+import ujson
+
+from src.json_parser import JsonParser
+from src.quarantine import JsonlQuarantine, MemoryQuarantine
+from tests.conftest import ListQueue, make_product, random_export
+
+
+def test_rejected_products_are_quarantined(tmp_path, write_export) -> None:
+    malformed = make_product("C", "3/синий", [])
+    del malformed["in_the_sale"]
+    products = [
+        make_product("A", "1/черный", [], sex="?"),
+        make_product("B", "черный", []),
+        malformed,
+        make_product("D", "1/черный", []),
+    ]
+    path = tmp_path / "rejected.jsonl"
+    quarantine = JsonlQuarantine(str(path), batch_size=2)
+    queue = ListQueue()
+    JsonParser(write_export(products), queue, quarantine=quarantine).run()
+
+    assert [prod["sku"] for prod in queue] == ["D"]
+    records = [ujson.loads(line) for line in path.read_text().splitlines()]
+    assert {record.pop("run_id") for record in records} == {quarantine.run_id}
+    assert all(record.pop("rejected_at") for record in records)
+    assert records == [
+        {"reason": "unknown_sex", "product": products[0]},
+        {"reason": "unknown_color_delimiter", "product": products[1]},
+        {"reason": "malformed", "product": products[2]},
+    ]
+    assert quarantine.counts == {"unknown_sex": 1, "unknown_color_delimiter": 1, "malformed": 1}
+
+
+def test_sharded_quarantine(write_export) -> None:
+    json_file = write_export(random_export(seed=0))
+
+    single = MemoryQuarantine()
+    JsonParser(json_file, ListQueue(), sequential=False, quarantine=single).run()
+    sharded = MemoryQuarantine()
+    JsonParser(json_file, ListQueue(), workers=2, quarantine=sharded).run()
+
+    assert single.records
+    # Записи, отклоненные в шардах после головной записи всей выгрузки, в карантин не попадают
+    def key(record):
+        return [record["reason"], record["product"]]
+
+    assert list(map(key, sharded.records)) == list(map(key, single.records))
+    assert {record["run_id"] for record in sharded.records} == {sharded.run_id}
+
+
+def test_runs_are_distinguishable(tmp_path, write_export) -> None:
+    json_file = write_export([make_product("A", "1/черный", [], sex="?")])
+    path = tmp_path / "rejected.jsonl"
+    run_ids = []
+    for _ in range(2):
+        quarantine = JsonlQuarantine(str(path))
+        JsonParser(json_file, ListQueue(), quarantine=quarantine).run()
+        run_ids.append(quarantine.run_id)
+
+    records = [ujson.loads(line) for line in path.read_text().splitlines()]
+    assert [record["run_id"] for record in records] == run_ids
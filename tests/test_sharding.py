@@ -0,0 +1,118 @@
+import pytest
+import ujson
+
+from src.sharding import consolidate_shard, export_files, merge_shards, split_export
+from src.json_stream import find_item_start
+from src.quarantine import MemoryQuarantine
+from tests.conftest import ListQueue, make_product, random_export
+
+
+@pytest.mark.parametrize("shards", [1, 2, 5, 13, 64])
+def test_merge_shards_matches_single_process(write_export, run_parser, shards: int) -> None:
+    products = random_export(seed=shards)
+    expected = run_parser(products, sequential=False)
+
+    json_file = write_export(products)
+    spans = split_export(json_file, shards)
+    assert len(spans) == shards
+    shards = [consolidate_shard(json_file, span) for span in spans]
+    result = [
+        product.to_dict() 
+        for product in merge_shards((groups, rejected) for groups, _, rejected in shards)
+    ]
+
+    assert result == expected
+
+
+def test_process_pool(write_export, run_parser) -> None:
+    products = random_export(seed=0)
+    expected = run_parser(products, sequential=False)
+
+    from src.json_parser import JsonParser
+    queue = ListQueue()
+    JsonParser(write_export(products), queue, workers=2).run()
+
+    assert list(queue) == expected
+
+
+def test_item_start_skips_braces_in_strings(write_export) -> None:
+    tricky = make_product("A", "1/черный", [{"size": "S", "count": 1, "price": 1}])
+    tricky["title"] = 'x},{"sku": "B"}, {  [ ,{'
+    products = [tricky, make_product("B", "1/черный", [])]
+    json_file = write_export(products)
+    text = open(json_file, "rb").read()
+    second = text.index(b'"sku": "B"', text.index(b'"sku": "A"'))
+    second = text.rindex(b"{", 0, second)
+
+    with open(json_file, "rb") as file:
+        assert find_item_start(file, 0, "sku") == text.index(b"{")
+        assert find_item_start(file, text.index(b"{") + 1, "sku") == second
+        assert find_item_start(file, second + 1, "sku") is None
+
+
+@pytest.mark.parametrize("pattern", ["", "*.json"])
+def test_multiple_files(tmp_path, run_parser, pattern: str) -> None:
+    """Выгрузки складов объединяются так же, как одна общая выгрузка"""
+    products = random_export(seed=3)
+    expected = run_parser(products, sequential=False)
+
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    for idx, start in enumerate(range(0, len(products), 70)):
+        warehouse = ujson.dumps(products[start:start + 70], ensure_ascii=False, indent=4)
+        (exports / f"warehouse_{idx}.json").write_text(warehouse)
+    json_files = export_files(str(exports / pattern))
+    assert len(json_files) == 5
+    # Порядок файлов - по имени
+    assert json_files == sorted(json_files)
+
+    from src.json_parser import JsonParser
+    queue = ListQueue()
+    JsonParser(str(exports / pattern), queue, workers=2).run()
+
+    assert list(queue) == expected
+
+
+def test_record_without_leftovers(write_export, run_parser) -> None:
+    """Запись без остатков отклоняется как в одном процессе, а не роняет процесс пула"""
+    broken = make_product("A", "1/черный", [])
+    del broken["leftovers"]
+    products = [broken, make_product("B", "1/черный", [{"size": "S", "count": 1, "price": 1}])]
+    expected = run_parser(products, sequential=False)
+
+    json_file = write_export(products)
+    groups, _, rejected = consolidate_shard(json_file, split_export(json_file, 1)[0])
+
+    assert [product.to_dict() for product in merge_shards([(groups, rejected)])] == expected
+    assert [record["reason"] for _, record in rejected] == ["malformed"]
+
+
+def test_cross_shard_quarantine(write_export) -> None:
+    """
+    Запись, отклоненная в шарде без своей головной записи, попадает в карантин,
+    только если головную запись не нашел ни один из предыдущих шардов
+    """
+    leftovers = [{"size": "S", "count": 1, "price": 1}]
+    first = [make_product("A", "1/черный", leftovers)]
+    second = [
+        make_product("A-1", "1/черный", leftovers, sex="?"),
+        make_product("B", "1/черный", leftovers, sex="?"),
+        make_product("B-1", "1/черный", leftovers),
+    ]
+    single = MemoryQuarantine()
+    queue = ListQueue()
+    from src.json_parser import JsonParser
+    JsonParser(write_export(first + second), queue, sequential=False, quarantine=single).run()
+
+    shards = []
+    for idx, products in enumerate([first, second]):
+        json_file = write_export(products, name=f"shard-{idx}.json")
+        groups, _, rejected = consolidate_shard(json_file, split_export(json_file, 1)[0])
+        shards.append((groups, rejected))
+    sharded = MemoryQuarantine()
+    result = [product.to_dict() for product in merge_shards(shards, sharded)]
+    sharded.flush()
+
+    assert result == list(queue)
+    assert [record["product"]["sku"] for record in single.records] == ["B"]
+    assert [record["product"]["sku"] for record in sharded.records] == ["B"]
@@ -0,0 +1,106 @@
+from typing import Dict, List
+
+import pytest
+import ujson
+
+import src.sinks as sinks
+from src.main import make_sink
+from src.metrics import Metrics
+from src.json_parser import JsonParser
+from src.sinks import (
+    BufferedSink, 
+    FanOutSink, 
+    JsonlSink, 
+    MemorySink, 
+    NullSink, 
+    ParquetSink, 
+    SinkQueue,
+)
+from tests.conftest import ListQueue, random_export
+
+
+PRODUCTS = [
+    {
+        "sku": f"A{idx}",
+        "brand": {"name": "Бренд", "slug": "brend"},
+        "leftovers": [{"size": "S", "count": idx, "price": 10}],
+    }
+    for idx in range(5)
+]
+
+
+class InsertSink(BufferedSink):
+    """Как insert_many, добавляет в записанные документы _id"""
+    def __init__(self) -> None:
+        super().__init__(batch_size=2)
+        self.docs: List[Dict] = []
+
+    def _write_batch(self, batch: List[Dict]) -> None:
+        for product in batch:
+            product["_id"] = object()
+        self.docs.extend(batch)
+
+
+def test_jsonl_sink(tmp_path) -> None:
+    path = tmp_path / "products.jsonl"
+    metrics = Metrics()
+    sink = JsonlSink(str(path), batch_size=2, metrics=metrics)
+    for product in PRODUCTS:
+        sink.write(product)
+    sink.close()
+
+    assert [ujson.loads(line) for line in path.read_text().splitlines()] == PRODUCTS
+    stats = metrics.stage("jsonl_write")
+    assert stats.calls == 3 and stats.items == 5
+
+
+def test_fan_out_sink(tmp_path) -> None:
+    path = tmp_path / "products.jsonl"
+    insert_sink, memory_sink, null_sink = InsertSink(), MemorySink(), NullSink()
+    sink = FanOutSink([insert_sink, JsonlSink(str(path), batch_size=2), memory_sink, null_sink])
+    for product in PRODUCTS:
+        sink.write(dict(product))
+    sink.close()
+
+    assert len(insert_sink.docs) == 5 and all("_id" in doc for doc in insert_sink.docs)
+    # Служебные поля одного приемника не попадают в другие
+    assert [ujson.loads(line) for line in path.read_text().splitlines()] == PRODUCTS
+    assert memory_sink.products == PRODUCTS
+    assert sink.written == null_sink.written == 5
+
+
+def test_parquet_sink(tmp_path) -> None:
+    path = str(tmp_path / "products.parquet")
+    if sinks.pa is None:
+        with pytest.raises(RuntimeError):
+            ParquetSink(path)
+        return
+
+    sink = ParquetSink(path, batch_size=2)
+    for product in PRODUCTS:
+        sink.write(product)
+    sink.close()
+    rows = sinks.pq.read_table(path).to_pylist()
+    assert [row["sku"] for row in rows] == [product["sku"] for product in PRODUCTS]
+    assert rows[1]["leftovers"] == [{"size": "S", "count": 1, "price": 10.0}]
+
+
+def test_make_sink() -> None:
+    metrics = Metrics()
+    assert type(make_sink(["null"], metrics, mongo_writer=None)).__name__ == "NullSink"
+
+    fan_out = make_sink(["memory", "null"], metrics, mongo_writer=None)
+    assert [type(sink).__name__ for sink in fan_out.sinks] == ["MemorySink", "NullSink"]
+    with pytest.raises(ValueError):
+        make_sink(["kafka"], metrics, mongo_writer=None)
+
+
+def test_sink_queue(tmp_path) -> None:
+    json_file = tmp_path / "export.json"
+    json_file.write_text(ujson.dumps(random_export(seed=0), ensure_ascii=False))
+    expected = ListQueue()
+    JsonParser(str(json_file), expected).run()
+
+    queue = SinkQueue(MemorySink())
+    JsonParser(str(json_file), queue).run()
+    assert queue.sink.products == list(expected)
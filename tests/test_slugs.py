@@ -0,0 +1,28 @@
+import itertools
+
+from slugify import slugify
+
+from src.slugs import cached_slugify, join_slugs
+
+
+def test_join_slugs_matches_slugify() -> None:
+    brands = ["Dolce&Gabbana", "Хоум Концепт", "L'Oréal", "", "  -Brand- "]
+    colors = ["", "черный", "Тёмно-синий", "80999", "731"]
+    skus = ["BB7337-AW576", "L24337", "ab12cd-34ef56.gh-78", "1,000"]
+    for brand, color_code, color, sku in itertools.product(brands, colors, colors, skus):
+        slug = join_slugs(
+            cached_slugify(brand), 
+            cached_slugify(color_code), 
+            cached_slugify(color), 
+            slugify(sku),
+        )
+        assert slug == slugify(f"{brand}+{color_code}+{color}+{sku}")
+
+
+def test_cached_slugify_counters() -> None:
+    cached_slugify.cache_clear()
+    for _ in range(3):
+        assert cached_slugify("Парфюмерия") == slugify("Парфюмерия")
+
+    info = cached_slugify.cache_info()
+    assert info.hits == 2 and info.misses == 1
@@ -0,0 +1,109 @@
+from typing import Dict, List
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from src.writers import BatchWriter, SyncWriter, CONTENT_HASH_FIELD, content_hash
+from src.models import UNIQUE_ID_FIELD
+
+
+class FakeCollection:
+    """Коллекция, отклоняющая товары с sku из rejected"""
+    def __init__(self, rejected: List[str]) -> None:
+        self.rejected = rejected
+        self.docs: List[Dict] = []
+        self.calls = 0
+
+    def insert_many(self, docs: List[Dict], ordered: bool) -> None:
+        self.calls += 1
+        errors = []
+        inserted = 0
+        for idx, doc in enumerate(docs):
+            if doc["sku"] in self.rejected:
+                errors.append({"index": idx, "code": 11000, "errmsg": "duplicate key"})
+                if ordered:
+                    break
+                continue
+            self.docs.append(doc)
+            inserted += 1
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_batch_writer(ordered: bool) -> None:
+    collection = FakeCollection(rejected=["B", "D"])
+    writer = BatchWriter(collection, batch_size=3, ordered=ordered)
+    for sku in "ABCDEFG":
+        writer.write({"sku": sku})
+    writer.close()
+
+    assert [doc["sku"] for doc in collection.docs] == list("ACEFG")
+    assert writer.written == 5 and writer.failed == 2
+    # Товары, уже записанные в коллекцию, считаются, а не логируются по одному
+    assert writer.duplicates == 2
+
+
+def test_batch_writer_batches() -> None:
+    collection = FakeCollection(rejected=[])
+    writer = BatchWriter(collection, batch_size=1000, ordered=False)
+    for idx in range(2500):
+        writer.write({"sku": str(idx)})
+    writer.close()
+
+    assert collection.calls == 3 and writer.written == 2500
+
+
+class FakeSyncCollection:
+    """Коллекция с upsert по unique_id"""
+    name = "products"
+
+    def __init__(self) -> None:
+        self.docs: Dict[str, Dict] = {}
+        self.replaced = 0
+
+    def index_information(self) -> Dict:
+        return {}
+
+    def create_indexes(self, indexes: List) -> List[str]:
+        return [index.document["name"] for index in indexes]
+
+    def find(self, filter: Dict, projection: Dict) -> List[Dict]:
+        keys = filter[UNIQUE_ID_FIELD]["$in"]
+        return [self.docs[key] for key in keys if key in self.docs]
+
+    def bulk_write(self, requests: List, ordered: bool) -> None:
+        for request in requests:
+            doc = request._doc
+            self.docs[doc[UNIQUE_ID_FIELD]] = dict(doc)
+            self.replaced += 1
+
+
+def test_sync_writer_skips_unchanged() -> None:
+    def products(first_count: int) -> List[Dict]:
+        return [
+            {UNIQUE_ID_FIELD: f"{sku}1/черный", "sku": sku, "leftovers": [{"count": count}]}
+            for sku, count in (("A", first_count), ("B", 2), ("C", 3))
+        ]
+
+    collection = FakeSyncCollection()
+    writer = SyncWriter(collection, batch_size=2, ordered=False)
+    for product in products(first_count=1):
+        writer.write(product)
+    writer.close()
+    assert collection.replaced == 3 and writer.skipped == 0
+
+    writer = SyncWriter(collection, batch_size=2, ordered=False)
+    for product in products(first_count=5):
+        writer.write(product)
+    writer.close()
+    assert collection.replaced == 4 and writer.skipped == 2
+    assert collection.docs["A1/черный"]["leftovers"] == [{"count": 5}]
+
+
+def test_content_hash_ignores_service_fields() -> None:
+    product = {"sku": "A", "leftovers": [{"size": "S", "count": 1}]}
+    product_hash = content_hash(product)
+
+    assert content_hash({**product, "_id": 1, CONTENT_HASH_FIELD: "x"}) == product_hash
+    assert content_hash({**product, "sku": "B"}) != product_hash